@@ -0,0 +1,111 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from etl_kruiz import coerce, coerce_cellwise, compile_plan, detect_int_overflows
+
+# =====================================================
+# SYNTHETIC DATA
+# =====================================================
+SCHEMA = [
+    ("hotel_code", "text"),
+    ("name", "character varying"),
+    ("phone_number", "text"),
+    ("links", "jsonb"),
+    ("pet_amenities", "jsonb"),
+    ("is_pet_friendly", "boolean"),
+    ("has_pet_deposit", "boolean"),
+    ("max_pets", "integer"),
+    ("max_weight", "integer"),
+    ("sabre_rating", "double precision"),
+    ("pet_fee_night", "numeric"),
+    ("last_updated", "timestamp without time zone"),
+]
+NULLS = [None, "", "  ", "nan", "NULL", "None", float("nan")]
+POLICIES = [json.dumps({"policy": f"Dogs up to {n} lbs allowed"}) for n in (25, 50, 75)]
+
+def maybe_null(rng, value, p=0.15):
+    return rng.choice(NULLS) if rng.random() < p else value
+
+def build_frame(rows, seed):
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        data.append({
+            "hotel_code": maybe_null(rng, f"  H{i} ", 0.01),
+            "name": maybe_null(rng, f"Hotel {rng.randint(1, 9999)}\t"),
+            "phone_number": maybe_null(rng, rng.choice(["+1 (205) 555-0100", "205.555.0100 ext 4", "n/a"])),
+            "links": maybe_null(rng, rng.choice(['{"map_url": "https://x"}', "not json", "[]"])),
+            "pet_amenities": maybe_null(rng, rng.choice(POLICIES)),
+            "is_pet_friendly": maybe_null(rng, rng.choice(["true", " Yes", "0", "FALSE", "y", "maybe"])),
+            "max_pets": maybe_null(rng, rng.choice(["2", " 3 ", "1.9", "9999999999", "-4", "two", "1e3"])),
+            # read_sql hands nullable boolean/integer columns over as objects without any strings
+            "has_pet_deposit": None if rng.random() < 0.15 else rng.choice([True, False]),
+            "max_weight": None if rng.random() < 0.15 else rng.choice([25, 50, 9999999999]),
+            "sabre_rating": maybe_null(rng, rng.choice(["4.5", " 3 ", "1,200.5", "bad", "inf"])),
+            "pet_fee_night": maybe_null(rng, rng.choice(["75", "1,000", "25.50", "free"])),
+            # read_sql hands timestamps over as datetimes already
+            "last_updated": None if rng.random() < 0.15 else datetime.datetime(2025, 1, 1) + datetime.timedelta(minutes=i),
+        })
+    return pd.DataFrame(data)
+
+# =====================================================
+# BENCHMARK
+# =====================================================
+def coerce_reference(df, schema):
+    """The pre-plan transform: cell-by-cell coerce plus the full-frame passes."""
+    df = df[[c for c, _ in schema if c in df.columns]].copy()
+    df = coerce_cellwise(df, schema)
+    df = df.where(pd.notnull(df), None)
+    df = detect_int_overflows(df)
+    return df.astype(object).where(pd.notna(df), None)
+
+def same_cell(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return a == b
+
+def compare(old, new):
+    """Column -> number of differing cells (empty when identical)."""
+    diffs = {}
+    for col in old.columns:
+        n = sum(not same_cell(a, b) for a, b in zip(old[col].tolist(), new[col].tolist()))
+        if n:
+            diffs[col] = n
+    return diffs
+
+def main():
+    parser = argparse.ArgumentParser(description="Cell-by-cell vs vectorized coerce() benchmark")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df = build_frame(args.rows, args.seed)
+    print(f"📦 {len(df)} synthetic rows, {len(SCHEMA)} columns")
+
+    start = time.perf_counter()
+    old = coerce_reference(df, SCHEMA)
+    old_time = time.perf_counter() - start
+    print(f"🐢 cell by cell:  {old_time:8.2f}s")
+
+    start = time.perf_counter()
+    new = coerce(df, compile_plan(SCHEMA))
+    new_time = time.perf_counter() - start
+    print(f"🚀 vectorized:    {new_time:8.2f}s")
+
+    diffs = compare(old, new)
+    print(f"⚡ speedup: {old_time / new_time:.2f}x — results identical: {not diffs}")
+    if diffs:
+        print("Differing cells per column:", diffs)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
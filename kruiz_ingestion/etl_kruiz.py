@@ -1,9 +1,16 @@
 import os
+import re
 import json
+import time
+import queue
+import argparse
+import threading
 import psycopg2
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
-from psycopg2.extras import execute_batch
+from sqlalchemy import create_engine, text
+from psycopg2.extras import execute_batch, execute_values
+from psycopg2.sql import Identifier
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +18,21 @@ load_dotenv()
 INT4_MIN = -2147483648
 INT4_MAX = 2147483647
 NULL_STRINGS = {"", "nan", "NaN", "None", "null", "NULL"}
+TRUE_STRINGS = {"true", "1", "yes", "y"}
+JSON_COLUMNS = {"links", "pet_amenities", "pet_fee_variations"}
+
+SOURCE_TABLE = "public.web_scraped_hotels"
+TARGET_TABLE = "ingestion.web_scraped_hotel"
+WATERMARK_TABLE = "ingestion.etl_watermarks"
+KEY_COLUMN = "hotel_code"
+# A row's change time is the first of these present in the source table.
+# updated_at is stamped by the database; last_updated comes from the
+# scraper and may be skewed, so it is only a fallback.
+CHANGE_COLUMNS = ("updated_at", "last_updated")
+CHANGED_AT = "_etl_changed_at"
+QUEUE_SIZE = 2  # chunks buffered between the extract, transform and load stages
+SHADOW_SUFFIX = "_shadow"
+SWAP_LOCK_TIMEOUT = "10s"  # give up the swap rather than queue readers behind a long query
 
 # =====================================================
 # DATABASE CONNECTIONS
@@ -63,7 +85,7 @@ def safe_bool(v):
     if isinstance(v, (int, float)):
         return bool(v)
     if isinstance(v, str):
-        return v.strip().lower() in {"true", "1", "yes", "y"}
+        return v.strip().lower() in TRUE_STRINGS
     return None
 
 def safe_json_text(v):
@@ -103,10 +125,10 @@ def get_target_schema():
     return [(n, t) for n, t in rows if n != "id"]
 
 # =====================================================
-# COERCION
+# COERCION (cell by cell; reference for benchmark_coerce.py)
 # =====================================================
-def coerce(df, schema):
-    json_cols = {"links", "pet_amenities", "pet_fee_variations"}
+def coerce_cellwise(df, schema):
+    json_cols = JSON_COLUMNS
     for col, dtype in schema:
         if col not in df.columns:
             continue
@@ -138,53 +160,549 @@ def detect_int_overflows(df):
     return df
 
 # =====================================================
-# MAIN ETL
+# WATERMARKS
+# =====================================================
+def ensure_watermark_table(cur):
+    # Stored as text so it round-trips in the source column's own type
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            target_table text PRIMARY KEY,
+            watermark text,
+            synced_at timestamptz NOT NULL DEFAULT now()
+        );
+    """)
+
+def get_watermark(cur):
+    cur.execute(f"SELECT watermark FROM {WATERMARK_TABLE} WHERE target_table = %s", (TARGET_TABLE,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def set_watermark(cur, watermark):
+    cur.execute(f"""
+        INSERT INTO {WATERMARK_TABLE} (target_table, watermark, synced_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (target_table) DO UPDATE
+        SET watermark = EXCLUDED.watermark, synced_at = EXCLUDED.synced_at;
+    """, (TARGET_TABLE, watermark))
+
+# =====================================================
+# EXTRACT
 # =====================================================
-def run_etl():
-    print("🔌 Loading local web_scraped_hotels...")
-    engine = create_engine(
+def local_engine():
+    return create_engine(
         f"postgresql+psycopg2://{LOCAL_DB['user']}:{LOCAL_DB['password']}@"
         f"{LOCAL_DB['host']}:{LOCAL_DB['port']}/{LOCAL_DB['dbname']}"
     )
 
-    df = pd.read_sql(
-        """SELECT * FROM public.web_scraped_hotels """,
+def get_change_column(engine):
+    cols = pd.read_sql(
+        """SELECT column_name FROM information_schema.columns
+           WHERE table_schema = 'public' AND table_name = 'web_scraped_hotels'""",
+        engine
+    )["column_name"].tolist()
+    return next((c for c in CHANGE_COLUMNS if c in cols), None)
+
+def extract(engine, since=None, chunksize=None):
+    """
+    Read source rows changed after `since` (all rows when None). Returns
+    a list with one DataFrame or, with chunksize, an iterator of frames
+    streamed through a server-side cursor. Frames carry a CHANGED_AT
+    column when the source has a change column.
+    """
+    change_col = get_change_column(engine)
+    if change_col is None and since is not None:
+        raise SystemExit(f"❌ {SOURCE_TABLE} has no {'/'.join(CHANGE_COLUMNS)} column; use --mode full")
+
+    sql = f"SELECT * FROM {SOURCE_TABLE}"
+    params = {}
+    if change_col is not None:
+        sql = f"SELECT *, {change_col} AS {CHANGED_AT} FROM {SOURCE_TABLE}"
+        if since is not None:
+            sql += f" WHERE {change_col} > :since"
+            params["since"] = since
+
+    if not chunksize:
+        return [pd.read_sql(text(sql), engine, params=params)]
+    return read_chunks(engine, sql, params, chunksize)
+
+def read_chunks(engine, sql, params, chunksize):
+    with engine.connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql(text(sql), conn, params=params, chunksize=chunksize)
+
+def split_changed_at(df):
+    """Drop CHANGED_AT; returns (df, newest change time in the frame or None)."""
+    if CHANGED_AT not in df.columns:
+        return df, None
+    newest = df[CHANGED_AT].max() if len(df) else None
+    return df.drop(columns=CHANGED_AT), (newest if newest is not None and pd.notna(newest) else None)
+
+def extract_keys(engine):
+    """Every hotel_code in the source, normalised the way coerce() does."""
+    nulls = ", ".join(f"'{v}'" for v in sorted(NULL_STRINGS))
+    keys = pd.read_sql(
+        f"""SELECT DISTINCT btrim({KEY_COLUMN}) AS {KEY_COLUMN} FROM {SOURCE_TABLE}
+            WHERE btrim({KEY_COLUMN}) NOT IN ({nulls})""",
         engine
     )
-    print(f"📦 Loaded {len(df)} rows from local web_scraped_hotels")
+    return keys[KEY_COLUMN].tolist()
 
-    print("🧭 Fetching target schema...")
-    schema = get_target_schema()
-    target_cols = [c for c, _ in schema]
+# =====================================================
+# TRANSFORM (vectorized conversion plan)
+# =====================================================
+def to_objects(values, null, index):
+    """Object Series from an array-like, None where null is set."""
+    arr = np.asarray(values, dtype=object).copy()
+    arr[null] = None
+    return pd.Series(arr, index=index, dtype=object)
 
-    df = df[[c for c in target_cols if c in df.columns]]
-    df = coerce(df, schema)
-    df = detect_int_overflows(df)
-    df = df.astype(object).where(pd.notna(df), None)
+def text_values(s):
+    """Stripped string form of every cell plus the is_nullish() mask."""
+    stripped = s.astype(str).str.strip()
+    null = s.isna().to_numpy() | stripped.isin(NULL_STRINGS).to_numpy()
+    return stripped, null
 
-    print("⚠️ Truncating existing GCP ingestion.web_scraped_hotel table...")
-    conn = psycopg2.connect(**GCP_DB)
+def non_strings(s, null):
+    """Non-null cells that are not str (e.g. bools in an object column)."""
+    if s.dtype != object:
+        return np.zeros(len(s), dtype=bool)
+    # No .str accessor here: it raises on object columns without any strings
+    is_str = np.fromiter((isinstance(v, str) for v in s.to_numpy(dtype=object)), dtype=bool, count=len(s))
+    return ~null & ~is_str
+
+def numbers(s, cleanup=None):
+    """Float array of parseable cells (NaN otherwise) plus the null mask."""
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+        null = s.isna().to_numpy()
+        return s.astype(float).to_numpy(), null
+    stripped, null = text_values(s)
+    if cleanup:
+        stripped = stripped.str.replace(cleanup, "", regex=False)
+    num = pd.to_numeric(stripped.where(~null), errors="coerce").astype(float).to_numpy()
+    return num, null
+
+def convert_text(s):
+    stripped, null = text_values(s)
+    return to_objects(stripped, null, s.index)
+
+def convert_phone(s):
+    stripped, null = text_values(s)
+    return to_objects(stripped.str.replace(r"[^0-9+ \-()]", "", regex=True), null, s.index)
+
+def convert_json(s):
+    # JSON validity can only be checked per value; each distinct text is checked once
+    _, null = text_values(s)
+    values = s.to_numpy(dtype=object)
+    out = np.full(len(s), None, dtype=object)
+    seen = {}
+    for i in np.flatnonzero(~null):
+        v = values[i]
+        if isinstance(v, str):
+            if v not in seen:
+                seen[v] = safe_json_text(v)
+            out[i] = seen[v]
+        else:
+            out[i] = safe_json_text(v)
+    return pd.Series(out, index=s.index, dtype=object)
+
+def convert_bool(s):
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+        null = s.isna().to_numpy()
+        return to_objects(s.fillna(0).astype(bool), null, s.index)
+    stripped, null = text_values(s)
+    out = to_objects(stripped.str.lower().isin(TRUE_STRINGS), null, s.index)
+    odd = non_strings(s, null)
+    if odd.any():
+        out[odd] = s[odd].map(safe_bool)
+    return out
+
+def convert_int4(s):
+    num, null = numbers(s)
+    with np.errstate(invalid="ignore"):
+        num = np.trunc(num)
+        bad = null | ~np.isfinite(num) | (num < INT4_MIN) | (num > INT4_MAX)
+    ints = pd.Series(np.where(bad, 0, num), index=s.index).astype("int64")
+    out = to_objects(ints.astype(object), bad, s.index)
+    odd = non_strings(s, null)
+    if odd.any():
+        out[odd] = s[odd].map(safe_int4)
+    return out
+
+def convert_float(s):
+    num, null = numbers(s, cleanup=",")
+    out = to_objects(pd.Series(num).astype(object), null | np.isnan(num), s.index)
+    odd = non_strings(s, null)
+    if odd.any():
+        out[odd] = s[odd].map(safe_float)
+    return out
+
+def convert_timestamp(s):
+    ts = pd.to_datetime(s, errors="coerce")
+    return to_objects(ts.astype(object), ts.isna().to_numpy(), s.index)
+
+def convert_other(s):
+    return to_objects(s.astype(object), s.isna().to_numpy(), s.index)
+
+def compile_plan(schema):
+    """
+    Turn the target schema into [(column, converter)] once per run. Every
+    converter returns an object Series holding None for NULL, ready to load.
+    """
+    plan = []
+    for col, dtype in schema:
+        if col == "phone_number":
+            convert = convert_phone
+        elif col in JSON_COLUMNS:
+            convert = convert_json
+        elif dtype in ("text", "character varying"):
+            convert = convert_text
+        elif dtype == "boolean":
+            convert = convert_bool
+        elif dtype == "integer":
+            convert = convert_int4
+        elif dtype in ("double precision", "numeric"):
+            convert = convert_float
+        elif "timestamp" in dtype:
+            convert = convert_timestamp
+        else:
+            convert = convert_other
+        plan.append((col, convert))
+    return plan
+
+def coerce(df, plan):
+    """Apply a compiled plan; builds the output frame once from converted columns."""
+    return pd.DataFrame({col: convert(df[col]) for col, convert in plan if col in df.columns}, index=df.index)
+
+# =====================================================
+# LOAD
+# =====================================================
+def copy_value(v):
+    """Render one value in COPY text format (None -> \\N)."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v, ensure_ascii=False)
+    elif hasattr(v, "isoformat"):
+        v = v.isoformat()
+    else:
+        v = str(v)
+    return v.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+class CopyStream:
+    """Read-only file object that pulls COPY lines from a generator on demand."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            chunk, self.buffer = self.buffer, ""
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def copy_rows(cur, table, df):
+    lines = ("\t".join(copy_value(v) for v in row) + "\n" for row in df.itertuples(index=False, name=None))
+    cur.copy_expert(f"COPY {table} ({','.join(df.columns)}) FROM STDIN", CopyStream(lines))
+
+def insert_rows(cur, table, df, method="copy"):
+    """Load a coerced frame into `table` with COPY (streamed) or execute_batch."""
+    if method == "copy":
+        copy_rows(cur, table, df)
+        return
+    cols = ",".join(df.columns)
+    placeholders = ",".join(["%s"] * len(df.columns))
+    sql = f"INSERT INTO {table} ({cols}) VALUES ({placeholders})"
+    execute_batch(cur, sql, df.values.tolist(), page_size=500)
+
+def load_full(conn, frames, method="copy"):
+    print(f"⚠️ Truncating existing GCP {TARGET_TABLE} table...")
     cur = conn.cursor()
-    cur.execute("TRUNCATE TABLE ingestion.web_scraped_hotel;")
+    cur.execute(f"TRUNCATE TABLE {TARGET_TABLE};")
     conn.commit()
 
     print("☁️ Inserting new data into GCP...")
-    cols = ",".join(df.columns)
-    placeholders = ",".join(["%s"] * len(df.columns))
-    sql = f"INSERT INTO ingestion.web_scraped_hotel ({cols}) VALUES ({placeholders})"
+    inserted = 0
+    for df in frames:
+        insert_rows(cur, TARGET_TABLE, df, method)
+        inserted += len(df)
+    cur.close()
+    return inserted
+
+def quote_ident(cur, name):
+    return Identifier(name).as_string(cur)
+
+def shadow_name(name):
+    """name + SHADOW_SUFFIX, kept within Postgres' 63-byte identifier limit."""
+    return name[:63 - len(SHADOW_SUFFIX)] + SHADOW_SUFFIX
+
+def copy_indexes(cur, source, target):
+    """
+    Rebuild source's primary key, unique/exclusion and foreign-key
+    constraints and its remaining indexes on target, under shadow names.
+    Returns [(kind, shadow name, original name)] to rename after the swap.
+    """
+    cur.execute("""
+        SELECT conname, contype, conindid, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'x', 'f')
+        ORDER BY contype = 'f', conname
+    """, (source,))
+    constraints = cur.fetchall()
+    renames = []
+    for name, _, _, definition in constraints:
+        temp = shadow_name(name)
+        cur.execute(f"ALTER TABLE {target} ADD CONSTRAINT {quote_ident(cur, temp)} {definition};")
+        renames.append(("constraint", temp, name))
+
+    # Indexes behind the constraints above were just rebuilt with them
+    backing = [indid for _, contype, indid, _ in constraints if contype != "f" and indid]
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass AND NOT (i.indexrelid = ANY(%s::oid[]))
+        ORDER BY c.relname
+    """, (source, backing))
+    for name, definition in cur.fetchall():
+        temp = shadow_name(name)
+        definition = re.sub(r"^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ",
+                            lambda m: f"CREATE {m.group(1) or ''}INDEX {quote_ident(cur, temp)} ON {target} ",
+                            definition)
+        cur.execute(definition)
+        renames.append(("index", temp, name))
+    return renames
+
+def copy_grants(cur, source, target):
+    """LIKE does not copy privileges; re-grant source's to target so readers keep access."""
+    cur.execute("""
+        SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE pg_get_userbyid(a.grantee) END,
+               string_agg(a.privilege_type, ', ')
+        FROM pg_class c, aclexplode(c.relacl) a
+        WHERE c.oid = %s::regclass AND a.grantee <> c.relowner
+        GROUP BY 1
+    """, (source,))
+    for grantee, privileges in cur.fetchall():
+        grantee = grantee if grantee == "PUBLIC" else quote_ident(cur, grantee)
+        cur.execute(f"GRANT {privileges} ON {target} TO {grantee};")
+
+def owned_sequences(cur, table):
+    """(sequence, column) pairs for serial sequences owned by `table`, which DROP TABLE would take with it."""
+    cur.execute("""
+        SELECT d.objid::regclass::text, a.attname
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+    """, (table,))
+    return cur.fetchall()
+
+def load_swap(conn, frames, method="copy"):
+    """
+    Full refresh without an empty window. The rows go into a shadow table
+    created LIKE the target, its indexes and constraints are built once the
+    data is in, it is ANALYZEd, and then renamed over the target. Readers
+    keep seeing the old rows until the caller commits; the target is only
+    locked for the renames at the very end.
+    """
+    schema, table = TARGET_TABLE.split(".")
+    shadow = f"{schema}.{shadow_name(table)}"
+    old = f"{table}_old"
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {shadow};")
+    cur.execute(f"CREATE TABLE {shadow} (LIKE {TARGET_TABLE} INCLUDING ALL EXCLUDING INDEXES);")
+
+    print(f"☁️ Loading new data into {shadow}...")
+    inserted = 0
+    for df in frames:
+        insert_rows(cur, shadow, df, method)
+        inserted += len(df)
+
+    print("🏗️ Building indexes and statistics on the shadow table...")
+    renames = copy_indexes(cur, TARGET_TABLE, shadow)
+    copy_grants(cur, TARGET_TABLE, shadow)
+    cur.execute(f"ANALYZE {shadow};")
+
+    print(f"🔀 Swapping {shadow} in for {TARGET_TABLE}...")
+    cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';")
+    sequences = owned_sequences(cur, TARGET_TABLE)
+    cur.execute(f"ALTER TABLE {TARGET_TABLE} RENAME TO {old};")
+    cur.execute(f"ALTER TABLE {shadow} RENAME TO {table};")
+    for sequence, column in sequences:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TARGET_TABLE}.{quote_ident(cur, column)};")
+    cur.execute(f"DROP TABLE {schema}.{old};")
+    for kind, temp, name in renames:
+        if kind == "constraint":
+            cur.execute(f"ALTER TABLE {TARGET_TABLE} RENAME CONSTRAINT {quote_ident(cur, temp)} TO {quote_ident(cur, name)};")
+        else:
+            cur.execute(f"ALTER INDEX {schema}.{quote_ident(cur, temp)} RENAME TO {quote_ident(cur, name)};")
+    cur.close()
+    return inserted
+
+def load_incremental(conn, frames, source_keys, method="copy"):
+    """
+    Stage the changed rows, upsert them on hotel_code, then delete target
+    rows whose hotel_code no longer exists in the source (anti-join
+    against a temp table of source keys). Returns (upserted, deleted).
+    """
+    cur = conn.cursor()
+    cur.execute(f"CREATE TEMP TABLE etl_stage (LIKE {TARGET_TABLE} INCLUDING DEFAULTS) ON COMMIT DROP;")
+    columns = None
+    for df in frames:
+        if len(df):
+            columns = list(df.columns)
+            insert_rows(cur, "etl_stage", df, method)
 
+    upserted = 0
+    if columns:
+        cols = ", ".join(columns)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != KEY_COLUMN)
+        cur.execute(f"""
+            INSERT INTO {TARGET_TABLE} ({cols})
+            SELECT DISTINCT ON ({KEY_COLUMN}) {cols}
+            FROM etl_stage
+            ORDER BY {KEY_COLUMN}
+            ON CONFLICT ({KEY_COLUMN}) DO UPDATE SET {updates};
+        """)
+        upserted = cur.rowcount
+
+    deleted = 0
+    if source_keys:
+        cur.execute(f"CREATE TEMP TABLE etl_source_keys ({KEY_COLUMN} text) ON COMMIT DROP;")
+        execute_values(cur, f"INSERT INTO etl_source_keys ({KEY_COLUMN}) VALUES %s",
+                       [(k,) for k in source_keys], page_size=5000)
+        cur.execute(f"""
+            DELETE FROM {TARGET_TABLE} t
+            WHERE t.{KEY_COLUMN} IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM etl_source_keys s WHERE s.{KEY_COLUMN} = t.{KEY_COLUMN});
+        """)
+        deleted = cur.rowcount
+    else:
+        print("⚠️ Source has no hotel codes; skipping the deletion pass")
+    cur.close()
+    return upserted, deleted
+
+# =====================================================
+# STREAMING
+# =====================================================
+def pipeline(source, stage, maxsize=QUEUE_SIZE):
+    """
+    Run stage() over `source` in a background thread and yield the
+    results through a bounded queue, so the caller's work on one item
+    overlaps with the production of the next. Errors are re-raised here.
+    """
+    results = queue.Queue(maxsize=maxsize)
+    errors = []
+    done = object()
+
+    def worker():
+        try:
+            for item in source:
+                results.put(stage(item))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            results.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+# =====================================================
+# MAIN ETL
+# =====================================================
+def run_etl(mode="full", load_method="copy", chunk_size=None):
+    conn = psycopg2.connect(**GCP_DB)
+    cur = conn.cursor()
+    ensure_watermark_table(cur)
+    since = get_watermark(cur) if mode == "incremental" else None
+    conn.commit()
+    cur.close()
+
+    print("🧭 Fetching target schema...")
+    plan = compile_plan(get_target_schema())
+
+    engine = local_engine()
+    if mode == "incremental":
+        print(f"🔌 Loading local web_scraped_hotels changed after {since or 'the beginning'}...")
+    else:
+        print("🔌 Loading local web_scraped_hotels...")
+    frames = extract(engine, since, chunk_size)
+
+    stats = {"rows": 0, "newest": None}
+
+    def transform(df):
+        df, newest = split_changed_at(df)
+        if newest is not None and (stats["newest"] is None or newest > stats["newest"]):
+            stats["newest"] = newest
+        stats["rows"] += len(df)
+        df = coerce(df, plan)
+        if mode == "incremental":
+            missing = df[KEY_COLUMN].isna()
+            if missing.any():
+                print(f"⚠️ Skipping {int(missing.sum())} changed rows without a hotel_code")
+                df = df[~missing]
+        return df
+
+    if chunk_size:
+        # extract | transform | load, each stage in its own thread
+        print(f"🌊 Streaming in chunks of {chunk_size} rows")
+        frames = pipeline(pipeline(frames, lambda df: df), transform)
+    else:
+        frames = [transform(df) for df in frames]
+        print(f"📦 Loaded {stats['rows']} rows from local web_scraped_hotels")
+
+    started = time.perf_counter()
     try:
-        execute_batch(cur, sql, df.values.tolist(), page_size=500)
+        if mode == "incremental":
+            print("☁️ Upserting changes into GCP...")
+            upserted, deleted = load_incremental(conn, frames, extract_keys(engine), load_method)
+        elif mode == "truncate":
+            inserted = load_full(conn, frames, load_method)
+        else:
+            inserted = load_swap(conn, frames, load_method)
+        watermark = str(stats["newest"]) if stats["newest"] is not None else since
+        cur = conn.cursor()
+        if watermark is not None:
+            set_watermark(cur, watermark)
+        cur.close()
         conn.commit()
-        print(f"✅ ETL completed successfully! Inserted {len(df)} hotels 🎉")
+        if chunk_size:
+            print(f"📦 Streamed {stats['rows']} rows from local web_scraped_hotels")
+        print(f"⏱️ Load ({load_method}) took {time.perf_counter() - started:.1f}s")
+        if mode == "incremental":
+            print(f"✅ Incremental sync completed! Upserted {upserted}, deleted {deleted} hotels 🎉")
+        else:
+            print(f"✅ ETL completed successfully! Inserted {inserted} hotels 🎉")
     except Exception as e:
         conn.rollback()
-        print("❌ Insert failed:", e)
+        print("❌ Load failed:", e)
         raise
     finally:
-        cur.close()
         conn.close()
 
 # =====================================================
 if __name__ == "__main__":
-    run_etl()
+    parser = argparse.ArgumentParser(description="Sync local web_scraped_hotels to GCP ingestion.web_scraped_hotel")
+    parser.add_argument("--mode", choices=["full", "truncate", "incremental"], default="full",
+                        help="full: load a shadow table and swap it in; truncate: truncate and reload in place; "
+                             "incremental: upsert changes since the last watermark")
+    parser.add_argument("--load-method", choices=["copy", "batch"], default="copy",
+                        help="copy: stream COPY ... FROM STDIN; batch: execute_batch INSERTs")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="stream the source in chunks of N rows (extract/transform/load overlap)")
+    args = parser.parse_args()
+    run_etl(mode=args.mode, load_method=args.load_method, chunk_size=args.chunk_size)
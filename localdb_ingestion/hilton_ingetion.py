@@ -1,8 +1,11 @@
+import argparse
 import json
 import re
 from datetime import datetime
 import psycopg2
 from psycopg2.extras import Json
+from ingestion_engine import ChainAdapter, format_stats, ingest_chain, iter_hotels
+import pet_policy_parser
 
 # =====================================================
 # CONFIG
@@ -60,254 +63,83 @@ def parse_pet_policy(pet_text):
     """
     Normalizes pet policy into structured fields.
     """
-    if not pet_text:
-        return {
-            "fee": None,
-            "deposit": None,
-            "currency": None,
-            "interval": None,
-            "pet_types": None,
-            "weight_limit": None,
-            "max_pets": None,
-            "free_pets": False
-        }
-
-    text = pet_text.lower()
-
-    # ---------- Free pets ----------
-    if any(x in text for x in [
-        "no extra charge",
-        "no additional charge",
-        "free of charge",
-        "at no charge"
-    ]):
-        return {
-            "fee": 0.0,
-            "deposit": None,
-            "currency": None,
-            "interval": None,
-            "pet_types": None,
-            "weight_limit": None,
-            "max_pets": None,
-            "free_pets": True
-        }
-
-    # ---------- Currency ----------
-    currency = None
-    if "$" in pet_text:
-        currency = "USD"
-
-    # ---------- Numbers ----------
-    numbers = []
-    for m in re.finditer(r"(\d[\d,]*(?:\.\d+)?)", pet_text):
-        try:
-            numbers.append(float(m.group(1).replace(",", "")))
-        except ValueError:
-            pass
-
-    fee = None
-    deposit = None
+    return pet_policy_parser.parse_pet_policy(pet_text, fee_index=0, max_pets="pets")
 
-    if "deposit" in text and numbers:
-        deposit = numbers[0]
-    elif "fee" in text and numbers:
-        fee = numbers[0]
-
-    # ---------- Interval ----------
-    interval = None
-    if "per night" in text:
-        interval = "per_night"
-    elif "per stay" in text:
-        interval = "per_stay"
-
-    # ---------- Pet types ----------
-    pet_types = []
-    if "dog" in text:
-        pet_types.append("dog")
-    if "cat" in text:
-        pet_types.append("cat")
-    pet_types = ", ".join(pet_types) if pet_types else None
-
-    # ---------- Weight ----------
-    weight_limit = None
-    w = re.search(r"(\d+\s?(kg|kgs|lb|lbs))", text)
-    if w:
-        weight_limit = w.group(1)
-
-    # ---------- Max pets ----------
-    max_pets = None
-    m = re.search(r"(\d+)\s*pets", text)
-    if m:
-        max_pets = int(m.group(1))
-
-    return {
-        "fee": fee,
-        "deposit": deposit,
-        "currency": currency,
-        "interval": interval,
-        "pet_types": pet_types,
-        "weight_limit": weight_limit,
-        "max_pets": max_pets,
-        "free_pets": False
-    }
+def identity_key(name, city, state, country):
+    """Key that identifies a Hilton hotel across runs; None without a name."""
+    if not name:
+        return None
+    return (name.lower(), city, state, country)
 
-def get_last_ingested_timestamp(cur):
+def load_existing_codes(cur):
+    """
+    Preload identity key -> hotel_code for every Hilton row, so existing
+    hotels are resolved in memory instead of one SELECT per JSON record.
+    """
     cur.execute("""
-        SELECT MAX(last_updated)
+        SELECT hotel_code, name, city, state, country
         FROM hotel_masterfile
         WHERE chain_code = %s
+        ORDER BY hotel_code
     """, (CHAIN_CODE,))
-    row = cur.fetchone()
-    return row[0] if row and row[0] else None
+    codes = {}
+    for hotel_code, name, city, state, country in cur.fetchall():
+        key = identity_key(name, city, state, country)
+        if key:
+            codes.setdefault(key, hotel_code)
+    return codes
 
 
 
 
 # =====================================================
-# INGESTION
+# ADAPTER
 # =====================================================
-def ingest():
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    last_db_updated = get_last_ingested_timestamp(cur)
-    print("🕒 Last Hilton record in DB:", last_db_updated)
-    with open(JSON_FILE, "r", encoding="utf-8") as f:
-        hotels = json.load(f)
-
-    # Track hotel_code increment
-    hotel_counter = START_HOTEL_ID
-
-    insert_sql = """
-    INSERT INTO hotel_masterfile (
-        hotel_code,
-        chain_code,
-        chain,
-        name,
-        full_address,
-        city,
-        state,
-        country,
-        phone_number,
-        sabre_rating,
-        description,
-        parking,
-        is_pet_friendly,
-        pet_policy,
-        pet_fee_total_max,
-        pet_fee_deposit,
-        pet_fee_currency,
-        pet_fee_interval,
-        allowed_pet_types,
-        weight_limit,
-        max_pets,
-        has_pet_deposit,
-        has_pet_friendly_rooms,
-        pet_amenities,
-        nearby_parks,
-        source,
-        last_updated,
-        primary_airport_code,
-        links
-    )
-    VALUES (
-        %(hotel_code)s,
-        %(chain_code)s,
-        %(chain)s,
-        %(name)s,
-        %(full_address)s,
-        %(city)s,
-        %(state)s,
-        %(country)s,
-        %(phone)s,
-        %(rating)s,
-        %(description)s,
-        %(parking)s,
-        %(is_pet_friendly)s,
-        %(pet_policy)s,
-        %(pet_fee)s,
-        %(pet_deposit)s,
-        %(currency)s,
-        %(interval)s,
-        %(pet_types)s,
-        %(weight_limit)s,
-        %(max_pets)s,
-        %(has_deposit)s,
-        %(has_pet_rooms)s,
-        %(amenities)s,
-        %(nearby)s,
-        %(source)s,
-        %(updated)s,
-        %(primary_airport_code)s,
-        %(links)s
+class HiltonAdapter(ChainAdapter):
+    chain_code = CHAIN_CODE
+    columns = (
+        "hotel_code",
+        "chain_code",
+        "chain",
+        "name",
+        "full_address",
+        "city",
+        "state",
+        "country",
+        "phone_number",
+        "sabre_rating",
+        "description",
+        "parking",
+        "is_pet_friendly",
+        "pet_policy",
+        "pet_fee_total_max",
+        "pet_fee_deposit",
+        "pet_fee_currency",
+        "pet_fee_interval",
+        "allowed_pet_types",
+        "weight_limit",
+        "max_pets",
+        "has_pet_deposit",
+        "has_pet_friendly_rooms",
+        "pet_amenities",
+        "nearby_parks",
+        "source",
+        "last_updated",
+        "primary_airport_code",
+        "links",
     )
-    ON CONFLICT (hotel_code) DO UPDATE SET
-        name = EXCLUDED.name,
-        full_address = EXCLUDED.full_address,
-        city = EXCLUDED.city,
-        state = EXCLUDED.state,
-        country = EXCLUDED.country,
-        phone_number = EXCLUDED.phone_number,
-        sabre_rating = EXCLUDED.sabre_rating,
-        description = EXCLUDED.description,
-        parking = EXCLUDED.parking,
-        is_pet_friendly = EXCLUDED.is_pet_friendly,
-        pet_policy = EXCLUDED.pet_policy,
-        pet_fee_total_max = EXCLUDED.pet_fee_total_max,
-        pet_fee_deposit = EXCLUDED.pet_fee_deposit,
-        pet_fee_currency = EXCLUDED.pet_fee_currency,
-        pet_fee_interval = EXCLUDED.pet_fee_interval,
-        allowed_pet_types = EXCLUDED.allowed_pet_types,
-        weight_limit = EXCLUDED.weight_limit,
-        max_pets = EXCLUDED.max_pets,
-        has_pet_deposit = EXCLUDED.has_pet_deposit,
-        has_pet_friendly_rooms = EXCLUDED.has_pet_friendly_rooms,
-        pet_amenities = EXCLUDED.pet_amenities,
-        nearby_parks = EXCLUDED.nearby_parks,
-        source = EXCLUDED.source,
-        last_updated = EXCLUDED.last_updated,
-        primary_airport_code = EXCLUDED.primary_airport_code,
-        links = EXCLUDED.links
-    ;
-    """
-
-    for h in hotels:
-
-
-        if h.get("last_updated"):
-            json_updated = datetime.fromisoformat(h.get("last_updated"))
 
-        # Skip old records
-        if last_db_updated and json_updated and json_updated <= last_db_updated:
-            continue
-        # Generate unique hotel_code
+    def prepare(self, cur):
+        self.hotel_counter = START_HOTEL_ID
+        self.known_codes = load_existing_codes(cur)
+        print(f"📚 Loaded {len(self.known_codes)} existing Hilton hotel codes")
 
+    def to_row(self, h):
+        # No last_updated pre-filter: with per-batch commits its MAX() moves
+        # mid-run, and the engine's content hash already skips unchanged rows
+        json_updated = datetime.fromisoformat(h.get("last_updated")) if h.get("last_updated") else None
 
-        # Try to find existing hotel
-        cur.execute("""
-            SELECT hotel_code
-            FROM hotel_masterfile
-            WHERE chain_code = %s
-            AND lower(name) = lower(%s)
-            AND city IS NOT DISTINCT FROM %s
-            AND state IS NOT DISTINCT FROM %s
-            AND country IS NOT DISTINCT FROM %s
-            LIMIT 1
-        """, (
-            CHAIN_CODE,
-            h.get("hotel_name"),
-            h.get("city"),
-            h.get("state"),
-            h.get("country")
-        ))
-
-        row = cur.fetchone()
-        if row:
-            hotel_code = row[0]   # UPDATE existing
-        else:
-            hotel_code = f"{hotel_counter}-{h.get('hotel_code','')}"
-            hotel_counter += 1    # INSERT new
-
-        # Pet policyhotel_code
+        # Pet policy
         pets = safe_json(h.get("pets_json"))
         pet_text = None
         if pets:
@@ -330,8 +162,7 @@ def ingest():
             address_parts = [h.get("hotel_name"), h.get("city"), h.get("state"), h.get("country")]
             address = ", ".join([p for p in address_parts if p])
 
-        data = {
-            "hotel_code": hotel_code,
+        return {
             "chain_code": CHAIN_CODE,
             "chain": CHAIN_NAME,
             "name": h.get("hotel_name") or "",
@@ -339,38 +170,57 @@ def ingest():
             "city": h.get("city") or None,
             "state": h.get("state") or None,
             "country": h.get("country") or None,
-            "phone": h.get("phone") or "",
-            "rating": parse_rating(h.get("rating")),
+            "phone_number": h.get("phone") or "",
+            "sabre_rating": parse_rating(h.get("rating")),
             "description": h.get("description") or "",
             "parking": Json(safe_json(h.get("parking_json"), {})),
             "is_pet_friendly": str(h.get("is_pet_friendly")).lower() == "true",
             "pet_policy": Json({"policy": pet_text}) if pet_text else None,
-            "pet_fee": pet_data["fee"],
-            "pet_deposit": pet_data["deposit"],
-            "currency": pet_data["currency"],
-            "interval": pet_data["interval"],
-            "pet_types": pet_data["pet_types"],
+            "pet_fee_total_max": pet_data["fee"],
+            "pet_fee_deposit": pet_data["deposit"],
+            "pet_fee_currency": pet_data["currency"],
+            "pet_fee_interval": pet_data["interval"],
+            "allowed_pet_types": pet_data["pet_types"],
             "weight_limit": pet_data["weight_limit"],
             "max_pets": pet_data["max_pets"],
-            "has_deposit": True if pet_data["deposit"] else False,
-            "has_pet_rooms": True if pet_text else None,
-            "amenities": Json(safe_json(h.get("amenities_json"), [])),
-            "nearby": Json(safe_json(h.get("nearby_json"), [])),
+            "has_pet_deposit": True if pet_data["deposit"] else False,
+            "has_pet_friendly_rooms": True if pet_text else None,
+            "pet_amenities": Json(safe_json(h.get("amenities_json"), [])),
+            "nearby_parks": Json(safe_json(h.get("nearby_json"), [])),
             "source": SOURCE_NAME,
-            "updated": datetime.fromisoformat(h.get("last_updated")),
+            "last_updated": json_updated,
             "primary_airport_code": primary_airport_code,
             "links": Json({"map_url": h.get("address_map_url")}) if h.get("address_map_url") else None,
         }
 
-        cur.execute(insert_sql, data)
+    def hotel_code(self, h, row):
+        key = identity_key(h.get("hotel_name"), h.get("city"), h.get("state"), h.get("country"))
+        hotel_code = self.known_codes.get(key) if key else None
+        if hotel_code is None:
+            hotel_code = f"{self.hotel_counter}-{h.get('hotel_code','')}"
+            self.hotel_counter += 1    # INSERT new
+            if key:
+                self.known_codes[key] = hotel_code
+        return hotel_code
 
-    conn.commit()
-    cur.close()
+# =====================================================
+# INGESTION
+# =====================================================
+def ingest(workers=1, resume=True):
+    conn = psycopg2.connect(**DB_CONFIG)
+    stats = ingest_chain(conn, HiltonAdapter(), iter_hotels(JSON_FILE), workers=workers,
+                         source=JSON_FILE, resume=resume)
     conn.close()
-    print("✅ Hilton ingestion completed successfully!")
+    print(f"✅ Hilton ingestion completed successfully! {format_stats(stats)}")
 
 # =====================================================
 # RUN
 # =====================================================
 if __name__ == "__main__":
-    ingest()
+    parser = argparse.ArgumentParser(description="Ingest Hilton hotels into hotel_masterfile")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse worker processes; >1 pipelines parsing with DB writes")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and start from the first record")
+    args = parser.parse_args()
+    ingest(workers=args.workers, resume=not args.restart)
@@ -1,7 +1,6 @@
-
-
+import argparse
 import psycopg2
-import json
+from ingestion_engine import chain_lock, copy_buffer, iter_hotels
 
 DB_CONFIG = {
     "host": "localhost",
@@ -12,38 +11,97 @@ DB_CONFIG = {
 }
 
 JSON_FILE = "hyatt_hotels.json"
+LOCK_KEY = "HYATT_PET_POLICY"  # advisory lock shared with run_ingestion.py
+PROGRESS_EVERY = 500  # hotels between progress updates
 
-conn = psycopg2.connect(**DB_CONFIG)
-cur = conn.cursor()
-
-with open(JSON_FILE, "r", encoding="utf-8") as f:
-    hotels = json.load(f)
-
-for h in hotels:
-    hotel_code = h.get("hotel_code", "").strip()
-    if not hotel_code:
-        continue
-
-    # Combine pet_policy_description + pet_fees_json
+def build_pet_policy(h):
+    """Combine pet_policy_description + pet_fees_json into one text."""
     pet_description = h.get("pet_policy_description") or ""
     pet_fees_list = h.get("pet_fees_json") or []
     pet_fees_text = "\n".join(pet_fees_list) if pet_fees_list else ""
     full_pet_policy = pet_description
     if pet_fees_text:
         full_pet_policy += "\n" + pet_fees_text
+    return full_pet_policy
+
+def collect_pet_policies(hotels, progress=False):
+    """Build hotel_code -> pet_policy; a later record for the same code wins."""
+    policies = {}
+    for i, h in enumerate(hotels, 1):
+        hotel_code = (h.get("hotel_code") or "").strip()
+        if hotel_code:
+            policies[hotel_code] = build_pet_policy(h)
+        if progress and i % PROGRESS_EVERY == 0:
+            print(f"\r🐾 Prepared {i} hotels...", end="", flush=True)
+    if progress:
+        print(f"\r🐾 Prepared {len(policies)} pet policies")
+    return policies
 
-    # Debug: check what is being updated
-    print(f"Updating hotel_code: {hotel_code}, pet_policy length: {len(full_pet_policy)}")
+def update_pet_policies(conn, policies, progress=False):
+    """
+    Apply all pet policies with set-based updates.
+    The pairs are COPYed into a temp table and joined to hotel_masterfile
+    on hotel_code, which uses the primary-key index. A second join catches
+    rows whose stored code carries stray whitespace, as TRIM() did before.
+    Returns (matched codes, unmatched codes).
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE hyatt_pet_policies (
+            hotel_code text PRIMARY KEY,
+            pet_policy text
+        ) ON COMMIT DROP;
+    """)
+    cur.copy_expert("COPY hyatt_pet_policies (hotel_code, pet_policy) FROM STDIN", copy_buffer(policies.items()))
+    if progress:
+        print(f"📤 Staged {len(policies)} pet policies")
 
-    # Update DB
     cur.execute("""
-        UPDATE hotel_masterfile
-        SET pet_policy = %s
-        WHERE TRIM(hotel_code) = %s
-    """, (full_pet_policy, hotel_code))
+        UPDATE hotel_masterfile m
+        SET pet_policy = s.pet_policy
+        FROM hyatt_pet_policies s
+        WHERE m.hotel_code = s.hotel_code
+        RETURNING s.hotel_code;
+    """)
+    matched = {row[0] for row in cur.fetchall()}
+
+    cur.execute("""
+        UPDATE hotel_masterfile m
+        SET pet_policy = s.pet_policy
+        FROM hyatt_pet_policies s
+        WHERE m.hotel_code <> TRIM(m.hotel_code)
+          AND TRIM(m.hotel_code) = s.hotel_code
+        RETURNING s.hotel_code;
+    """)
+    matched.update(row[0] for row in cur.fetchall())
+    if progress:
+        print(f"🔄 Updated pet_policy for {len(matched)} hotel codes")
+
+    conn.commit()
+    cur.close()
+    unmatched = sorted(set(policies) - matched)
+    return sorted(matched), unmatched
+
+def run(conn, json_file=JSON_FILE, progress=False):
+    """Collect and apply the pet policies under the Hyatt advisory lock."""
+    with chain_lock(conn, LOCK_KEY):
+        policies = collect_pet_policies(iter_hotels(json_file), progress=progress)
+        return update_pet_policies(conn, policies, progress=progress)
+
+def main():
+    parser = argparse.ArgumentParser(description="Update hotel_masterfile.pet_policy from the Hyatt scrape")
+    parser.add_argument("--json-file", default=JSON_FILE)
+    parser.add_argument("--progress", action="store_true", help="show progress while preparing and updating")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    matched, unmatched = run(conn, args.json_file, progress=args.progress)
+    conn.close()
 
-conn.commit()
-cur.close()
-conn.close()
+    print(f"✅ pet_policy column updated successfully from JSON file: {len(matched)} matched, {len(unmatched)} unmatched")
+    if unmatched:
+        print("⚠️ Hotel codes not found in hotel_masterfile:", ", ".join(unmatched[:20]),
+              "..." if len(unmatched) > 20 else "")
 
-print("✅ pet_policy column updated successfully from JSON file")
+if __name__ == "__main__":
+    main()
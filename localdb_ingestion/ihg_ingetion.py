@@ -1,8 +1,10 @@
+import argparse
 import json
-import re
 from datetime import datetime
 import psycopg2
 from psycopg2.extras import Json
+from ingestion_engine import ChainAdapter, CodeRegistry, format_stats, ingest_chain, iter_hotels
+import pet_policy_parser
 
 # =====================================================
 # CONFIG
@@ -44,240 +46,102 @@ def parse_pet_policy(pet_text):
     """
     Extremely defensive parser. Never throws.
     """
-    if not pet_text:
-        return {
-            "fee": None,
-            "deposit": None,
-            "currency": None,
-            "interval": None,
-            "pet_types": None,
-            "weight_limit": None,
-            "max_pets": None,
-            "free_pets": False
-        }
-
-    text = pet_text.lower()
-
-    # ---------- Free pets ----------
-    if any(x in text for x in [
-        "no extra charge",
-        "no additional charge",
-        "free of charge",
-        "at no charge"
-    ]):
-        return {
-            "fee": 0.0,
-            "deposit": None,
-            "currency": None,
-            "interval": None,
-            "pet_types": None,
-            "weight_limit": None,
-            "max_pets": None,
-            "free_pets": True
-        }
-
-    # ---------- Currency ----------
-    currency = None
-    if "$" in pet_text:
-        currency = "USD"
-
-    # ---------- Numbers ----------
-    numbers = []
-    for m in re.finditer(r"(\d[\d,]*(?:\.\d+)?)", pet_text):
-        try:
-            numbers.append(float(m.group(1).replace(",", "")))
-        except ValueError:
-            pass
-
-    fee = None
-    deposit = None
-
-    if "deposit" in text and numbers:
-        deposit = numbers[0]
-    elif "fee" in text and numbers:
-        fee = numbers[-1]
-
-    # ---------- Interval ----------
-    interval = None
-    if "per night" in text:
-        interval = "per_night"
-    elif "per stay" in text:
-        interval = "per_stay"
-
-    # ---------- Pet types ----------
-    pet_types = []
-    if "dog" in text:
-        pet_types.append("dog")
-    if "cat" in text:
-        pet_types.append("cat")
-    pet_types = ", ".join(pet_types) if pet_types else None
-
-    # ---------- Weight ----------
-    weight_limit = None
-    w = re.search(r"(\d+\s?(kg|kgs|lb|lbs))", text)
-    if w:
-        weight_limit = w.group(1)
-
-    # ---------- Max pets ----------
-    max_pets = None
-    m = re.search(r"up to\s*(\d+)", text)
-    if m:
-        max_pets = int(m.group(1))
-
-    return {
-        "fee": fee,
-        "deposit": deposit,
-        "currency": currency,
-        "interval": interval,
-        "pet_types": pet_types,
-        "weight_limit": weight_limit,
-        "max_pets": max_pets,
-        "free_pets": False
-    }
+    return pet_policy_parser.parse_pet_policy(pet_text, fee_index=-1, max_pets="up_to")
 
 # =====================================================
-# INGESTION
+# ADAPTER
 # =====================================================
 
-def ingest():
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-
-    with open(JSON_FILE, "r", encoding="utf-8") as f:
-        hotels = json.load(f)
-
-    insert_sql = """
-    INSERT INTO hotel_masterfile (
-        hotel_code,
-        chain_code,
-        chain,
-        name,
-        full_address,
-        phone_number,
-        sabre_rating,
-        description,
-        parking,
-        is_pet_friendly,
-        pet_policy,
-        pet_fee_total_max,
-        pet_fee_deposit,
-        pet_fee_currency,
-        pet_fee_interval,
-        allowed_pet_types,
-        weight_limit,
-        max_pets,
-        has_pet_deposit,
-        has_pet_friendly_rooms,
-        pet_amenities,
-        nearby_parks,
-        source,
-        last_updated
+class IHGAdapter(ChainAdapter):
+    chain_code = "IHG"
+    columns = (
+        "hotel_code",
+        "chain_code",
+        "chain",
+        "name",
+        "full_address",
+        "phone_number",
+        "sabre_rating",
+        "description",
+        "parking",
+        "is_pet_friendly",
+        "pet_policy",
+        "pet_fee_total_max",
+        "pet_fee_deposit",
+        "pet_fee_currency",
+        "pet_fee_interval",
+        "allowed_pet_types",
+        "weight_limit",
+        "max_pets",
+        "has_pet_deposit",
+        "has_pet_friendly_rooms",
+        "pet_amenities",
+        "nearby_parks",
+        "source",
+        "last_updated",
     )
-    VALUES (
-        %(hotel_code)s,
-        %(chain_code)s,
-        %(chain)s,
-        %(name)s,
-        %(address)s,
-        %(phone)s,
-        %(rating)s,
-        %(description)s,
-        %(parking)s,
-        %(is_pet_friendly)s,
-        %(pet_policy)s,
-        %(pet_fee)s,
-        %(pet_deposit)s,
-        %(currency)s,
-        %(interval)s,
-        %(pet_types)s,
-        %(weight_limit)s,
-        %(max_pets)s,
-        %(has_deposit)s,
-        %(has_pet_rooms)s,
-        %(amenities)s,
-        %(nearby)s,
-        %(source)s,
-        %(updated)s
-    )
-    ON CONFLICT (hotel_code) DO UPDATE SET
-        name = EXCLUDED.name,
-        full_address = EXCLUDED.full_address,
-        phone_number = EXCLUDED.phone_number,
-        sabre_rating = EXCLUDED.sabre_rating,
-        description = EXCLUDED.description,
-        parking = EXCLUDED.parking,
-        is_pet_friendly = EXCLUDED.is_pet_friendly,
-        pet_policy = EXCLUDED.pet_policy,
-        pet_fee_total_max = EXCLUDED.pet_fee_total_max,
-        pet_fee_deposit = EXCLUDED.pet_fee_deposit,
-        pet_fee_currency = EXCLUDED.pet_fee_currency,
-        pet_fee_interval = EXCLUDED.pet_fee_interval,
-        allowed_pet_types = EXCLUDED.allowed_pet_types,
-        weight_limit = EXCLUDED.weight_limit,
-        max_pets = EXCLUDED.max_pets,
-        has_pet_deposit = EXCLUDED.has_pet_deposit,
-        has_pet_friendly_rooms = EXCLUDED.has_pet_friendly_rooms,
-        pet_amenities = EXCLUDED.pet_amenities,
-        nearby_parks = EXCLUDED.nearby_parks,
-        source = EXCLUDED.source,
-        last_updated = EXCLUDED.last_updated;
-    """
 
-    hotel_code_counter = START_HOTEL_ID
-    unique_codes_set = set()
-
-    for h in hotels:
-        # Ensure unique hotel_code
-        while True:
-            new_code = f"{hotel_code_counter}-{h.get('hotel_code', 'unknown')}"
-            if new_code not in unique_codes_set:
-                unique_codes_set.add(new_code)
-                hotel_code_counter += 1
-                break
-            hotel_code_counter += 1
+    def prepare(self, cur):
+        self.registry = CodeRegistry(self.chain_code, "{n}-{key}", START_HOTEL_ID)
+        self.registry.load(cur)
+        print(f"📚 Loaded {len(self.registry.codes)} registered IHG hotel codes")
 
+    def to_row(self, h):
         pets = safe_json(h.get("pets_json"))
         pet_text = pets.get("policy") if pets else None
         pet_data = parse_pet_policy(pet_text)
 
-        data = {
-            "hotel_code": new_code,
+        return {
             "chain_code": "IHG",
             "chain": "IHG",
             "name": h.get("hotel_name"),
-            "address": h.get("address"),
-            "phone": h.get("phone"),
-            "rating": parse_rating(h.get("rating")),
+            "full_address": h.get("address"),
+            "phone_number": h.get("phone"),
+            "sabre_rating": parse_rating(h.get("rating")),
             "parking": Json(safe_json(h.get("parking_json"))),
             "is_pet_friendly": str(h.get("is_pet_friendly")).lower() == "true",
             "pet_policy": pet_text,
-            "pet_fee": pet_data["fee"],
-            "pet_deposit": pet_data["deposit"],
-            "currency": pet_data["currency"],
-            "interval": pet_data["interval"],
-            "pet_types": pet_data["pet_types"],
+            "pet_fee_total_max": pet_data["fee"],
+            "pet_fee_deposit": pet_data["deposit"],
+            "pet_fee_currency": pet_data["currency"],
+            "pet_fee_interval": pet_data["interval"],
+            "allowed_pet_types": pet_data["pet_types"],
             "weight_limit": pet_data["weight_limit"],
             "max_pets": pet_data["max_pets"],
             "description": h.get("description"),
-            "has_deposit": True if pet_data["deposit"] else False,
-            "has_pet_rooms": True if pet_text else None,
-            "amenities": Json(safe_json(h.get("amenities_json"))),
-            "nearby": Json(safe_json(h.get("nearby_json"))),
+            "has_pet_deposit": True if pet_data["deposit"] else False,
+            "has_pet_friendly_rooms": True if pet_text else None,
+            "pet_amenities": Json(safe_json(h.get("amenities_json"))),
+            "nearby_parks": Json(safe_json(h.get("nearby_json"))),
             "source": SOURCE,
-            "updated": datetime.fromisoformat(h.get("last_updated"))
+            "last_updated": datetime.fromisoformat(h.get("last_updated"))
         }
 
-        cur.execute(insert_sql, data)
+    def hotel_code(self, h, row):
+        # Stable code per IHG hotel_code, reused across runs
+        return self.registry.code_for(h.get("hotel_code"), h.get("hotel_code", "unknown"))
 
-    conn.commit()
-    cur.close()
+# =====================================================
+# INGESTION
+# =====================================================
+
+def ingest(workers=1, resume=True):
+    conn = psycopg2.connect(**DB_CONFIG)
+
+    stats = ingest_chain(conn, IHGAdapter(), iter_hotels(JSON_FILE), workers=workers,
+                         source=JSON_FILE, resume=resume)
     conn.close()
-    print("✅ IHG ingestion completed successfully with unique hotel codes")
+    print(f"✅ IHG ingestion completed successfully with unique hotel codes ({format_stats(stats)})")
 
 # =====================================================
 # RUN
 # =====================================================
 
 if __name__ == "__main__":
-    ingest()
-
+    parser = argparse.ArgumentParser(description="Ingest IHG hotels into hotel_masterfile")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse worker processes; >1 pipelines parsing with DB writes")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and start from the first record")
+    args = parser.parse_args()
+    ingest(workers=args.workers, resume=not args.restart)
@@ -0,0 +1,631 @@
+import collections
+import contextlib
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+try:  # incremental JSON parsing for multi-GB scraper files
+    import ijson
+except ImportError:  # fall back to json.load on the whole file
+    ijson = None
+
+# =====================================================
+# CONFIG
+# =====================================================
+TARGET_TABLE = "hotel_masterfile"
+STAGE_TABLE = "stage_hotel_masterfile"
+REGISTRY_TABLE = "hotel_code_registry"
+BATCH_SIZE = 1000  # rows per COPY + merge round trip
+PARSE_CHUNK_SIZE = 200  # hotels per task sent to a parse worker
+WRITE_QUEUE_SIZE = 4  # mapped batches buffered ahead of the writer thread
+CHECKPOINT_DIR = ".ingestion_checkpoints"  # last committed record per chain
+DEAD_LETTER_DIR = "dead_letters"  # <chain>.jsonl with records that failed
+LOCK_NAMESPACE = 4711  # first key of the per-chain advisory locks
+
+# Never overwritten when a hotel_code already exists
+KEY_COLUMNS = ("hotel_code", "chain_code", "chain")
+HASH_COLUMN = "content_hash"
+# Left out of the content hash: the key itself and the scraper's per-record
+# timestamp, which differs on every scrape even when nothing else changed
+UNHASHED_COLUMNS = ("hotel_code", "last_updated")
+
+# =====================================================
+# ADAPTER INTERFACE
+# =====================================================
+class ChainAdapter:
+    """
+    Field mapping for one chain's scraper output.
+
+    Subclasses set chain_code and columns (the hotel_masterfile columns they
+    fill, hotel_code included) and implement to_row() and hotel_code().
+    The engine handles batching and writing.
+    """
+    chain_code = None
+    columns = ()
+    registry = None  # CodeRegistry, when codes come from the persistent registry
+
+    def prepare(self, cur):
+        """Load per-run state (watermarks, existing codes) before the first record."""
+
+    def to_row(self, hotel):
+        """Map one scraped hotel to {column: value}, or None to skip it."""
+        raise NotImplementedError
+
+    def hotel_code(self, hotel, row):
+        """Return the masterfile hotel_code for a mapped row."""
+        raise NotImplementedError
+
+# =====================================================
+# HOTEL CODE REGISTRY
+# =====================================================
+class CodeRegistry:
+    """
+    Persistent source key -> hotel_code map for one chain.
+
+    code_format builds new codes from the next free number {n} and a
+    label {key} (usually the scraper's own code). Known source keys always
+    get their registered code back, so a reordered scrape file updates
+    rows in place instead of inserting duplicates. seed_key_sql is the SQL
+    expression over hotel_masterfile columns that yields the source key
+    of existing rows; by default it is the code with its number stripped.
+    """
+
+    def __init__(self, chain_code, code_format, start_id, seed_key_sql=None):
+        self.chain_code = chain_code
+        self.code_format = code_format
+        self.start_id = start_id
+        self.codes = {}
+        self.new_codes = []
+        self.next_id = start_id
+        head = code_format.split("{key}")[0]
+        self.prefix_pattern = "^" + r"\d+".join(re.escape(p) for p in head.split("{n}"))
+        self.seed_key_sql = seed_key_sql or "regexp_replace(hotel_code, %(pattern)s, '')"
+
+    def load(self, cur):
+        """
+        Load this chain's codes (the table comes from ensure_schema()). A
+        chain with no entries yet is seeded from its existing masterfile
+        codes, keeping the lowest-numbered code when a key appears more
+        than once.
+        """
+        cur.execute(f"SELECT source_key, hotel_code FROM {REGISTRY_TABLE} WHERE chain_code = %s", (self.chain_code,))
+        self.codes = dict(cur.fetchall())
+        if not self.codes:
+            cur.execute(f"""
+                INSERT INTO {REGISTRY_TABLE} (chain_code, source_key, hotel_code)
+                SELECT DISTINCT ON (source_key) %(chain)s, source_key, hotel_code
+                FROM (
+                    SELECT hotel_code,
+                           {self.seed_key_sql} AS source_key,
+                           split_part(hotel_code, '-', 1)::bigint AS n
+                    FROM {TARGET_TABLE}
+                    WHERE chain_code = %(chain)s AND hotel_code ~ %(pattern)s
+                ) m
+                WHERE source_key <> ''
+                ORDER BY source_key, n
+                ON CONFLICT DO NOTHING
+                RETURNING source_key, hotel_code;
+            """, {"chain": self.chain_code, "pattern": self.prefix_pattern})
+            self.codes = dict(cur.fetchall())
+
+        # New numbers start above everything the chain already uses
+        cur.execute(f"""
+            SELECT MAX(split_part(hotel_code, '-', 1)::bigint)
+            FROM {TARGET_TABLE}
+            WHERE chain_code = %s AND hotel_code ~ %s
+        """, (self.chain_code, self.prefix_pattern))
+        used = [cur.fetchone()[0] or 0]
+        used += [int(code.split("-", 1)[0]) for code in self.codes.values()]
+        self.next_id = max(self.start_id, max(used) + 1)
+        self.new_codes = []
+
+    def code_for(self, source_key, label):
+        """Registered code for source_key; a missing key always gets a fresh one."""
+        if source_key:
+            code = self.codes.get(source_key)
+            if code is not None:
+                return code
+        code = self.code_format.format(n=self.next_id, key=label)
+        self.next_id += 1
+        if source_key:
+            self.codes[source_key] = code
+            self.new_codes.append((self.chain_code, source_key, code))
+        return code
+
+    def drain(self):
+        """Hand over the codes assigned since the last call."""
+        entries, self.new_codes = self.new_codes, []
+        return entries
+
+def ensure_registry_table(cur):
+    cur.execute("SELECT to_regclass(%s)", (REGISTRY_TABLE,))
+    if cur.fetchone()[0] is None:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {REGISTRY_TABLE} (
+                chain_code text NOT NULL,
+                source_key text NOT NULL,
+                hotel_code text NOT NULL UNIQUE,
+                created_at timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (chain_code, source_key)
+            );
+        """)
+
+def save_codes(cur, entries):
+    if entries:
+        execute_values(cur, f"""
+            INSERT INTO {REGISTRY_TABLE} (chain_code, source_key, hotel_code)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+        """, entries)
+
+# =====================================================
+# SCRAPER INPUT
+# =====================================================
+def iter_hotels(path):
+    """
+    Yield scraped hotels one at a time.
+    .jsonl/.ndjson files are read line by line; a top-level JSON array is
+    parsed incrementally with ijson (or loaded whole when ijson is missing).
+    """
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "item", use_float=True)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+# =====================================================
+# COPY HELPERS
+# =====================================================
+def copy_value(value):
+    """Render one value in COPY text format."""
+    if isinstance(value, Json):
+        value = json.dumps(value.adapted)
+    if value is None or (isinstance(value, float) and value != value):
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+def copy_buffer(rows):
+    """In-memory COPY text stream for an iterable of tuples."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+# =====================================================
+# CHANGE DETECTION
+# =====================================================
+def content_hash(values):
+    """Fingerprint of a mapped row's COPY rendering, UNHASHED_COLUMNS excluded."""
+    text = "\t".join(copy_value(v) for v in values)
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+def ensure_hash_column(cur):
+    """
+    Add the content_hash column on first use. The catalog is checked
+    first, so a normal run never takes the ACCESS EXCLUSIVE lock that
+    ALTER TABLE needs.
+    """
+    schema, _, table = TARGET_TABLE.rpartition(".")
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+    """, (schema or "public", table, HASH_COLUMN))
+    if cur.fetchone() is None:
+        cur.execute(f"ALTER TABLE {TARGET_TABLE} ADD COLUMN IF NOT EXISTS {HASH_COLUMN} text;")
+
+def load_content_hashes(cur, chain_code):
+    """hotel_code -> content_hash for the chain's rows."""
+    cur.execute(f"""
+        SELECT hotel_code, {HASH_COLUMN}
+        FROM {TARGET_TABLE}
+        WHERE chain_code = %s AND {HASH_COLUMN} IS NOT NULL
+    """, (chain_code,))
+    return dict(cur.fetchall())
+
+def ensure_schema(conn):
+    """
+    One-time DDL for the engine: the content_hash column and the code
+    registry. Each step checks the catalog first and the result is
+    committed, so no DDL lock is held once chain jobs start reading
+    hotel_masterfile. run_ingestion.py calls this before starting the
+    jobs, so concurrent chains never race on the DDL.
+    """
+    cur = conn.cursor()
+    ensure_hash_column(cur)
+    ensure_registry_table(cur)
+    conn.commit()
+    cur.close()
+
+# =====================================================
+# BATCH WRITER
+# =====================================================
+def create_stage_table(cur):
+    cur.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE}
+        (LIKE {TARGET_TABLE} INCLUDING DEFAULTS);
+    """)
+    cur.execute(f"ALTER TABLE {STAGE_TABLE} ADD COLUMN IF NOT EXISTS load_seq bigserial;")
+
+def write_batch(cur, columns, rows):
+    """
+    COPY one batch into the staging table and merge it into
+    hotel_masterfile with a single INSERT ... SELECT ... ON CONFLICT.
+    The last row wins when a hotel_code repeats inside the batch.
+    Returns (inserted, updated).
+    """
+    if not rows:
+        return 0, 0
+
+    col_list = ", ".join(columns)
+    update_sql = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in KEY_COLUMNS)
+    cur.execute(f"TRUNCATE {STAGE_TABLE};")
+    cur.copy_expert(f"COPY {STAGE_TABLE} ({col_list}) FROM STDIN", copy_buffer(rows))
+    cur.execute(f"""
+        WITH merged AS (
+            INSERT INTO {TARGET_TABLE} ({col_list})
+            SELECT {col_list}
+            FROM (
+                SELECT DISTINCT ON (hotel_code) *
+                FROM {STAGE_TABLE}
+                ORDER BY hotel_code, load_seq DESC
+            ) s
+            ON CONFLICT (hotel_code) DO UPDATE SET
+            {update_sql}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM merged;
+    """)
+    return cur.fetchone()
+
+# =====================================================
+# CHAIN LOCKS
+# =====================================================
+class ChainBusy(Exception):
+    """Another session is already ingesting this chain."""
+
+@contextlib.contextmanager
+def chain_lock(conn, chain_code):
+    """
+    Hold the chain's session-level advisory lock for the duration of the
+    block, or raise ChainBusy if another session has it.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (LOCK_NAMESPACE, chain_code))
+    if not cur.fetchone()[0]:
+        conn.rollback()
+        cur.close()
+        raise ChainBusy(chain_code)
+    try:
+        yield
+    finally:
+        if not conn.closed:  # a dropped session releases its locks itself
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (LOCK_NAMESPACE, chain_code))
+            conn.commit()
+        cur.close()
+
+# =====================================================
+# CHECKPOINTS & DEAD LETTERS
+# =====================================================
+class Checkpoint:
+    """
+    Index of the next uncommitted record for one chain and source file.
+    A checkpoint only applies to the same file (path, size and mtime);
+    without a source path nothing is saved.
+    """
+
+    def __init__(self, chain_code, source=None):
+        self.path = os.path.join(CHECKPOINT_DIR, f"{chain_code}.json")
+        self.signature = None
+        if source:
+            st = os.stat(source)
+            self.signature = {
+                "chain": chain_code,
+                "source": os.path.abspath(source),
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+            }
+
+    def load(self):
+        if self.signature is None or not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if any(state.get(k) != v for k, v in self.signature.items()):
+            return 0
+        return state["next_record"]
+
+    def save(self, next_record):
+        if self.signature is None:
+            return
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.signature, next_record=next_record,
+                           saved_at=datetime.datetime.now().isoformat()), f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class DeadLetters:
+    """Append-only JSONL of records that failed to map or to write."""
+
+    def __init__(self, chain_code):
+        self.chain_code = chain_code
+        self.path = os.path.join(DEAD_LETTER_DIR, f"{chain_code}.jsonl")
+        self.count = 0
+        self.file = None
+        self.lock = threading.Lock()
+
+    def add(self, stage, record, hotel, error):
+        entry = {
+            "chain": self.chain_code,
+            "stage": stage,
+            "record": record,
+            "error": error,
+            "hotel": hotel,
+            "failed_at": datetime.datetime.now().isoformat(),
+        }
+        with self.lock:
+            if self.file is None:
+                os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write(json.dumps(entry, default=str) + "\n")
+            self.file.flush()
+            self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+# =====================================================
+# PARSE STAGE
+# =====================================================
+_worker_adapter = None
+
+def _init_parse_worker(adapter):
+    global _worker_adapter
+    _worker_adapter = adapter
+
+def map_hotel(adapter, hotel):
+    """(row, None) from adapter.to_row(), or (None, error) if it raised."""
+    try:
+        return adapter.to_row(hotel), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def _map_chunk(hotels):
+    return [map_hotel(_worker_adapter, h) for h in hotels]
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def map_serial(adapter, hotels):
+    for hotel in hotels:
+        yield (hotel,) + map_hotel(adapter, hotel)
+
+def map_parallel(adapter, hotels, workers):
+    """
+    Yield (hotel, row, error) in input order, with to_row() run in a
+    process pool. At most 2 * workers chunks are in flight, so memory
+    stays bounded however long the input stream is.
+    """
+    with multiprocessing.Pool(workers, initializer=_init_parse_worker, initargs=(adapter,)) as pool:
+        pending = collections.deque()
+        for chunk in chunked(hotels, PARSE_CHUNK_SIZE):
+            pending.append((chunk, pool.apply_async(_map_chunk, (chunk,))))
+            if len(pending) >= workers * 2:
+                done, result = pending.popleft()
+                yield from ((h,) + r for h, r in zip(done, result.get()))
+        while pending:
+            done, result = pending.popleft()
+            yield from ((h,) + r for h, r in zip(done, result.get()))
+
+# =====================================================
+# WRITE STAGE
+# =====================================================
+def write_chunk(conn, cur, columns, chunk, codes, dead_letters):
+    """
+    Write one batch of (record, hotel, values) in its own transaction.
+    If the set-based write is rejected, the rows are retried one by one
+    under savepoints and the failures go to the dead-letter file. A lost
+    connection is not retried. Returns (inserted, updated).
+    """
+    cur.execute("SAVEPOINT batch_write;")
+    try:
+        save_codes(cur, codes)
+        inserted, updated = write_batch(cur, columns, [values for _, _, values in chunk])
+    except psycopg2.OperationalError:
+        raise
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT batch_write;")
+        save_codes(cur, codes)
+        inserted = updated = 0
+        for record, hotel, values in chunk:
+            cur.execute("SAVEPOINT row_write;")
+            try:
+                row_inserted, row_updated = write_batch(cur, columns, [values])
+            except psycopg2.OperationalError:
+                raise
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT row_write;")
+                dead_letters.add("write", record, hotel, str(e).strip())
+                continue
+            inserted += row_inserted
+            updated += row_updated
+    conn.commit()
+    return inserted, updated
+
+def _writer_loop(write, batches, errors):
+    """Drain the batch queue into Postgres until the None sentinel arrives."""
+    while True:
+        item = batches.get()
+        if item is None:
+            return
+        if errors:
+            continue  # keep draining so the producer never blocks
+        try:
+            write(*item)
+        except Exception as e:
+            errors.append(e)
+
+# =====================================================
+# ENGINE
+# =====================================================
+def format_stats(stats):
+    text = (f"{stats['inserted']} inserted, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['skipped']} skipped, {stats['failed']} failed")
+    if stats["failed"]:
+        text += f" (see {DEAD_LETTER_DIR}/)"
+    if stats["resumed_from"]:
+        text += f"; resumed at record {stats['resumed_from']}"
+    return text
+
+def ingest_chain(conn, adapter, hotels, batch_size=BATCH_SIZE, workers=1, source=None, resume=True):
+    """
+    Run _ingest_chain under the chain's advisory lock, so the same chain
+    is never ingested by two sessions at once (raises ChainBusy).
+    """
+    with chain_lock(conn, adapter.chain_code):
+        return _ingest_chain(conn, adapter, hotels, batch_size, workers, source, resume)
+
+def _ingest_chain(conn, adapter, hotels, batch_size, workers, source, resume):
+    """
+    Map every hotel through the adapter and write the rows in batches.
+    With workers > 1, to_row() runs in a process pool and a writer thread
+    streams finished batches to Postgres through a bounded queue, so
+    parsing overlaps with database I/O. hotel_code() always runs here, in
+    input order. Rows whose content hash matches the stored one are not
+    sent at all.
+
+    Each batch is committed on its own and, when the source file path is
+    given, checkpointed; a rerun on the same file resumes after the last
+    committed batch unless resume is False. Records that fail to map or
+    to write go to the chain's dead-letter file instead of aborting.
+    Returns a stats dict with read, skipped (by the adapter), unchanged,
+    failed, inserted and updated counts, plus resumed_from.
+    """
+    ensure_schema(conn)
+    cur = conn.cursor()
+    adapter.prepare(cur)
+    known_hashes = load_content_hashes(cur, adapter.chain_code)
+    create_stage_table(cur)
+    conn.commit()
+
+    checkpoint = Checkpoint(adapter.chain_code, source)
+    dead_letters = DeadLetters(adapter.chain_code)
+    start = checkpoint.load() if resume else 0
+    if start:
+        hotels = itertools.islice(hotels, start, None)
+
+    columns = tuple(adapter.columns) + (HASH_COLUMN,)
+    hashed = [c not in UNHASHED_COLUMNS for c in adapter.columns]
+    stats = {"read": 0, "skipped": 0, "unchanged": 0, "failed": 0,
+             "inserted": 0, "updated": 0, "resumed_from": start}
+    errors = []
+
+    def new_codes():
+        # Registry entries travel with the batch that first uses them
+        return adapter.registry.drain() if adapter.registry is not None else []
+
+    def write(chunk, codes, next_record):
+        inserted, updated = write_chunk(conn, cur, columns, chunk, codes, dead_letters)
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        checkpoint.save(next_record)
+
+    if workers > 1:
+        mapped = map_parallel(adapter, hotels, workers)
+        batches = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = threading.Thread(target=_writer_loop, args=(write, batches, errors), daemon=True)
+        writer.start()
+
+        def emit(chunk, codes, next_record):
+            batches.put((chunk, codes, next_record))
+    else:
+        mapped = map_serial(adapter, hotels)
+        writer = None
+        emit = write
+
+    batch = []
+    record = start
+    try:
+        for record, (hotel, row, error) in enumerate(mapped, start):
+            stats["read"] += 1
+            if error is not None:
+                dead_letters.add("map", record, hotel, error)
+                continue
+            if row is None:
+                stats["skipped"] += 1
+                continue
+            hotel_code = row["hotel_code"] = adapter.hotel_code(hotel, row)
+            values = tuple(row.get(c) for c in adapter.columns)
+            digest = content_hash(v for v, h in zip(values, hashed) if h)
+            if known_hashes.get(hotel_code) == digest:
+                stats["unchanged"] += 1
+                continue
+            known_hashes[hotel_code] = digest
+            batch.append((record, hotel, values + (digest,)))
+            if len(batch) >= batch_size:
+                if errors:
+                    break
+                emit(batch, new_codes(), record + 1)
+                batch = []
+        if batch and not errors:
+            emit(batch, new_codes(), record + 1)
+    finally:
+        if writer is not None:
+            batches.put(None)
+            writer.join()
+            mapped.close()
+        dead_letters.close()
+        stats["failed"] = dead_letters.count
+
+    if errors:
+        conn.rollback()
+        cur.close()
+        raise errors[0]
+
+    checkpoint.clear()
+    cur.close()
+    return stats
@@ -1,9 +1,11 @@
 
 
+import argparse
 import json
-import re
 import psycopg2
 from psycopg2.extras import Json
+from ingestion_engine import ChainAdapter, CodeRegistry, format_stats, ingest_chain, iter_hotels
+from pet_policy_parser import parse_fee_table
 
 # ---------- CONFIG ----------
 DB_CONFIG = {
@@ -19,168 +21,115 @@ SOURCE = "marriott_scraper"
 CHAIN_CODE = "MAR"
 CHAIN_NAME = "Marriott International"
 START_HOTEL_ID = 1000  # starting unique id for hotel_code
+# Fields some repeated copies of a hotel leave blank; filled from other copies
+FILLABLE_COLUMNS = (
+    "state",
+    "country_code",
+    "country",
+    "city",
+    "postal_code",
+    "address_line_1",
+    "full_address",
+    "phone_number",
+)
 
 # ---------- LOAD JSON ----------
 def load_json(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return iter_hotels(file_path)
 
 # ---------- PARSE PET FEES ----------
 def parse_pet_fees(raw_text):
     """
     Parse pet fee info from raw text into structured fields
     """
-    result = {
-        "pet_fee_night": None,
-        "pet_fee_total_max": None,
-        "pet_fee_deposit": None,
-        "pet_fee_currency": None,
-        "pet_fee_interval": None,
-        "pet_fee_variations": None,
-        "has_pet_deposit": False,
-        "is_deposit_refundable": None
-    }
-
-    if not raw_text:
-        return result
-
-    # Match amounts + currency + interval
-    fee_pattern = re.compile(r"(\d+\.?\d*)\s*(USD|JOD|EUR|ILS)?\s*(Per Stay|Per Night|Deposit)?", re.IGNORECASE)
-    matches = fee_pattern.findall(raw_text)
-
-    for amt, currency, interval in matches:
-        amt = float(amt)
-        currency = currency if currency else "USD"
-        interval_lower = interval.lower() if interval else ""
-
-        if "per night" in interval_lower:
-            result["pet_fee_night"] = amt
-        elif "per stay" in interval_lower:
-            result["pet_fee_total_max"] = amt
-        elif "deposit" in interval_lower:
-            result["pet_fee_deposit"] = amt
-            result["has_pet_deposit"] = True
-
-        result["pet_fee_currency"] = currency
-        result["pet_fee_interval"] = interval if interval else None
-
-    # Non-refundable
-    result["is_deposit_refundable"] = False if "non-refundable" in raw_text.lower() else True
+    result = parse_fee_table(raw_text)
+    if result is None:
+        return {
+            "pet_fee_night": None,
+            "pet_fee_total_max": None,
+            "pet_fee_deposit": None,
+            "pet_fee_currency": None,
+            "pet_fee_interval": None,
+            "pet_fee_variations": None,
+            "has_pet_deposit": False,
+            "is_deposit_refundable": None
+        }
 
     # Store full raw variations
     result["pet_fee_variations"] = Json({"raw": raw_text})
-
     return result
 
-# ---------- INSERT HOTELS ----------
-def insert_hotels(data):
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-
-    insert_query = """
-    INSERT INTO public.hotel_masterfile (
-        hotel_code,
-        chain_code,
-        chain,
-        name,
-        state,
-        country_code,
-        country,
-        city,
-        postal_code,
-        address_line_1,
-        full_address,
-        description,
-        links,
-        phone_number,
-        is_pet_friendly,
-        pet_policy,
-        has_pet_friendly_rooms,
-        last_updated,
-        source,
-        sabre_rating,
-        pet_fee_night,
-        pet_fee_total_max,
-        pet_fee_deposit,
-        pet_fee_currency,
-        pet_fee_interval,
-        pet_fee_variations,
-        has_pet_deposit,
-        is_deposit_refundable
-    ) VALUES (
-        %(hotel_code)s,
-        %(chain_code)s,
-        %(chain)s,
-        %(name)s,
-        %(state)s,
-        %(country_code)s,
-        %(country)s,
-        %(city)s,
-        %(postal_code)s,
-        %(address_line_1)s,
-        %(full_address)s,
-        %(description)s,
-        %(links)s,
-        %(phone_number)s,
-        %(is_pet_friendly)s,
-        %(pet_policy)s,
-        %(has_pet_friendly_rooms)s,
-        %(last_updated)s,
-        %(source)s,
-        %(sabre_rating)s,
-        %(pet_fee_night)s,
-        %(pet_fee_total_max)s,
-        %(pet_fee_deposit)s,
-        %(pet_fee_currency)s,
-        %(pet_fee_interval)s,
-        %(pet_fee_variations)s,
-        %(has_pet_deposit)s,
-        %(is_deposit_refundable)s
-    )
-    ON CONFLICT ON CONSTRAINT hotel_code_unique DO UPDATE SET
-        name = EXCLUDED.name,
-        state = EXCLUDED.state,
-        country_code = EXCLUDED.country_code,
-        country = EXCLUDED.country,
-        city = EXCLUDED.city,
-        postal_code = EXCLUDED.postal_code,
-        address_line_1 = EXCLUDED.address_line_1,
-        full_address = EXCLUDED.full_address,
-        description = EXCLUDED.description,
-        links = EXCLUDED.links,
-        phone_number = EXCLUDED.phone_number,
-        is_pet_friendly = EXCLUDED.is_pet_friendly,
-        pet_policy = EXCLUDED.pet_policy,
-        has_pet_friendly_rooms = EXCLUDED.has_pet_friendly_rooms,
-        last_updated = EXCLUDED.last_updated,
-        source = EXCLUDED.source,
-        sabre_rating = EXCLUDED.sabre_rating,
-        pet_fee_night = EXCLUDED.pet_fee_night,
-        pet_fee_total_max = EXCLUDED.pet_fee_total_max,
-        pet_fee_deposit = EXCLUDED.pet_fee_deposit,
-        pet_fee_currency = EXCLUDED.pet_fee_currency,
-        pet_fee_interval = EXCLUDED.pet_fee_interval,
-        pet_fee_variations = EXCLUDED.pet_fee_variations,
-        has_pet_deposit = EXCLUDED.has_pet_deposit,
-        is_deposit_refundable = EXCLUDED.is_deposit_refundable;
+def is_blank(value):
+    """Empty scraper field: None, blank text or an empty Json wrapper."""
+    if isinstance(value, Json):
+        value = value.adapted
+    if isinstance(value, str):
+        value = value.strip()
+    return value is None or value == "" or value == {}
+
+def load_known_fields(cur):
     """
+    Name key -> FILLABLE_COLUMNS values of the chain's existing rows, so a
+    blank copy after a resume is still filled from what was written before.
+    """
+    cur.execute(f"""
+        SELECT lower(btrim(coalesce(name, ''))), {", ".join(FILLABLE_COLUMNS)}
+        FROM hotel_masterfile
+        WHERE chain_code = %s
+        ORDER BY hotel_code
+    """, (CHAIN_CODE,))
+    known = {}
+    for name_key, *values in cur:
+        if not name_key:
+            continue
+        previous = known.get(name_key)
+        if previous is not None:
+            values = [p if not is_blank(p) else v for p, v in zip(previous, values)]
+        known[name_key] = tuple(values)
+    return known
+
+# ---------- ADAPTER ----------
+class MarriottAdapter(ChainAdapter):
+    chain_code = CHAIN_CODE
+    columns = (
+        "hotel_code",
+        "chain_code",
+        "chain",
+        "name",
+        "state",
+        "country_code",
+        "country",
+        "city",
+        "postal_code",
+        "address_line_1",
+        "full_address",
+        "description",
+        "links",
+        "phone_number",
+        "is_pet_friendly",
+        "pet_policy",
+        "has_pet_friendly_rooms",
+        "last_updated",
+        "source",
+        "sabre_rating",
+        "pet_fee_night",
+        "pet_fee_total_max",
+        "pet_fee_deposit",
+        "pet_fee_currency",
+        "pet_fee_interval",
+        "pet_fee_variations",
+        "has_pet_deposit",
+        "is_deposit_refundable",
+    )
 
-    # Track hotel codes for uniqueness
-    hotel_code_counter = START_HOTEL_ID
-    unique_codes_set = set()
-
-    inserted_count = 0
-    for hotel in data:
-        base_code = hotel.get("hotel_code", "UNKNOWN")
-        # Generate a unique hotel_code
-        while True:
-            new_code = f"{hotel_code_counter}-{CHAIN_CODE}-{base_code}"
-            if new_code not in unique_codes_set:
-                unique_codes_set.add(new_code)
-                hotel_code_counter += 1
-                break
-            hotel_code_counter += 1
+    def prepare(self, cur):
+        # The scraper's hotel_code is a page position, so hotels are keyed by name
+        self.registry = CodeRegistry(CHAIN_CODE, "{n}-" + CHAIN_CODE + "-{key}", START_HOTEL_ID,
+                                     seed_key_sql="lower(btrim(coalesce(name, '')))")
+        self.registry.load(cur)
+        self.known_fields = load_known_fields(cur)
 
+    def to_row(self, hotel):
         # Parse pets
         raw_pets = hotel.get("pets_json")
         if isinstance(raw_pets, str) and raw_pets.strip():
@@ -190,8 +139,7 @@ def insert_hotels(data):
                 raw_pets = {}
         pet_fees = parse_pet_fees(raw_pets.get("raw") if raw_pets else None)
 
-        hotel_data = {
-            "hotel_code": new_code,
+        return {
             "chain_code": CHAIN_CODE,
             "chain": CHAIN_NAME,
             "name": hotel.get("hotel_name"),
@@ -214,16 +162,41 @@ def insert_hotels(data):
             **pet_fees
         }
 
-        cur.execute(insert_query, hotel_data)
-        inserted_count += 1
+    def fill_from_repeat(self, name_key, row):
+        """
+        The scrape repeats hotels, sometimes with blank address/city/phone
+        copies. Fill a repeat's blank FILLABLE_COLUMNS from the stored row
+        and earlier copies so a partial copy never overwrites a complete one.
+        """
+        previous = self.known_fields.get(name_key)
+        if previous is not None:
+            for column, value in zip(FILLABLE_COLUMNS, previous):
+                if is_blank(row.get(column)) and not is_blank(value):
+                    row[column] = value
+        self.known_fields[name_key] = tuple(row.get(c) for c in FILLABLE_COLUMNS)
+
+    def hotel_code(self, hotel, row):
+        # Stable code per hotel name, reused across runs
+        name_key = (row["name"] or "").strip().lower()
+        if name_key:
+            self.fill_from_repeat(name_key, row)
+        return self.registry.code_for(name_key, hotel.get("hotel_code", "UNKNOWN"))
 
-    conn.commit()
-    cur.close()
+# ---------- INSERT HOTELS ----------
+def insert_hotels(data, workers=1, source=None, resume=True):
+    conn = psycopg2.connect(**DB_CONFIG)
+    stats = ingest_chain(conn, MarriottAdapter(), data, workers=workers, source=source, resume=resume)
     conn.close()
-    print(f"Hotels inserted/updated with unique codes: {inserted_count}")
+    print(f"Hotels inserted/updated with unique codes: {stats['inserted'] + stats['updated']} "
+          f"({format_stats(stats)})")
 
 # ---------- MAIN ----------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest Marriott hotels into hotel_masterfile")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse worker processes; >1 pipelines parsing with DB writes")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and start from the first record")
+    args = parser.parse_args()
     hotels = load_json(JSON_FILE)
-    insert_hotels(hotels)
-
+    insert_hotels(hotels, workers=args.workers, source=JSON_FILE, resume=not args.restart)
@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+
+# =====================================================
+# CONFIG
+# =====================================================
+CACHE_SIZE = 8192  # distinct policy texts kept per parser
+
+FREE_CUES = (
+    "no extra charge",
+    "no additional charge",
+    "free of charge",
+    "at no charge",
+)
+CUES = FREE_CUES + ("deposit", "fee", "per night", "per stay", "dog", "cat")
+
+# One pass over the text finds every cue; the lookahead keeps overlapping hits
+CUE_RE = re.compile("(?=(" + "|".join(re.escape(c) for c in sorted(CUES, key=len, reverse=True)) + "))")
+NUMBER_RE = re.compile(r"(\d[\d,]*(?:\.\d+)?)")
+WEIGHT_RE = re.compile(r"(\d+\s?(kg|kgs|lb|lbs))")
+MAX_PETS_RES = {
+    "pets": re.compile(r"(\d+)\s*pets"),     # "2 pets"    (Hilton)
+    "up_to": re.compile(r"up to\s*(\d+)"),   # "up to 2"   (IHG)
+}
+FEE_TABLE_RE = re.compile(r"(\d+\.?\d*)\s*(USD|JOD|EUR|ILS)?\s*(Per Stay|Per Night|Deposit)?", re.IGNORECASE)
+
+EMPTY_POLICY = {
+    "fee": None,
+    "deposit": None,
+    "currency": None,
+    "interval": None,
+    "pet_types": None,
+    "weight_limit": None,
+    "max_pets": None,
+    "free_pets": False
+}
+
+# =====================================================
+# FREE-TEXT POLICIES (Hilton, IHG)
+# =====================================================
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_pet_policy(pet_text, fee_index, max_pets):
+    text = pet_text.lower()
+    cues = {m.group(1) for m in CUE_RE.finditer(text)}
+
+    # ---------- Free pets ----------
+    if not cues.isdisjoint(FREE_CUES):
+        return dict(EMPTY_POLICY, fee=0.0, free_pets=True)
+
+    # ---------- Numbers ----------
+    numbers = []
+    for m in NUMBER_RE.finditer(pet_text):
+        try:
+            numbers.append(float(m.group(1).replace(",", "")))
+        except ValueError:
+            pass
+
+    fee = None
+    deposit = None
+    if "deposit" in cues and numbers:
+        deposit = numbers[0]
+    elif "fee" in cues and numbers:
+        fee = numbers[fee_index]
+
+    # ---------- Interval ----------
+    interval = None
+    if "per night" in cues:
+        interval = "per_night"
+    elif "per stay" in cues:
+        interval = "per_stay"
+
+    # ---------- Pet types ----------
+    pet_types = [p for p in ("dog", "cat") if p in cues]
+
+    w = WEIGHT_RE.search(text)
+    m = MAX_PETS_RES[max_pets].search(text)
+    return {
+        "fee": fee,
+        "deposit": deposit,
+        "currency": "USD" if "$" in pet_text else None,
+        "interval": interval,
+        "pet_types": ", ".join(pet_types) if pet_types else None,
+        "weight_limit": w.group(1) if w else None,
+        "max_pets": int(m.group(1)) if m else None,
+        "free_pets": False
+    }
+
+def parse_pet_policy(pet_text, fee_index=0, max_pets="pets"):
+    """
+    Normalize a free-text pet policy into structured fields.
+    fee_index picks which number is the fee when several appear, and
+    max_pets names the MAX_PETS_RES pattern the chain's wording follows.
+    Results are cached per text; callers get their own copy.
+    """
+    if not pet_text:
+        return dict(EMPTY_POLICY)
+    return dict(_parse_pet_policy(pet_text, fee_index, max_pets))
+
+# =====================================================
+# FEE TABLES (Marriott)
+# =====================================================
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_fee_table(raw_text):
+    result = {
+        "pet_fee_night": None,
+        "pet_fee_total_max": None,
+        "pet_fee_deposit": None,
+        "pet_fee_currency": None,
+        "pet_fee_interval": None,
+        "has_pet_deposit": False,
+    }
+    for amt, currency, interval in FEE_TABLE_RE.findall(raw_text):
+        amt = float(amt)
+        interval_lower = interval.lower()
+
+        if "per night" in interval_lower:
+            result["pet_fee_night"] = amt
+        elif "per stay" in interval_lower:
+            result["pet_fee_total_max"] = amt
+        elif "deposit" in interval_lower:
+            result["pet_fee_deposit"] = amt
+            result["has_pet_deposit"] = True
+
+        result["pet_fee_currency"] = currency if currency else "USD"
+        result["pet_fee_interval"] = interval if interval else None
+
+    result["is_deposit_refundable"] = "non-refundable" not in raw_text.lower()
+    return result
+
+def parse_fee_table(raw_text):
+    """
+    Parse "<amount> <currency> <Per Stay|Per Night|Deposit>" fee text.
+    Returns a fresh dict of pet_fee_* fields, or None for empty text.
+    """
+    if not raw_text:
+        return None
+    return dict(_parse_fee_table(raw_text))
@@ -0,0 +1,120 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.pool import ThreadedConnectionPool
+from ingestion_engine import ChainBusy, ensure_schema, format_stats, ingest_chain, iter_hotels
+import hilton_ingetion
+import hyatt
+import ihg_ingetion
+import marriot_ingetion
+
+# =====================================================
+# CONFIG
+# =====================================================
+DB_CONFIG = {
+    "host": "localhost",
+    "port": 5432,
+    "dbname": "kruiz-dev",
+    "user": "postgres",
+    "password": "dost"
+}
+
+# name -> (adapter class, scraper file); each adapter is one advisory lock
+CHAINS = {
+    "hilton": (hilton_ingetion.HiltonAdapter, hilton_ingetion.JSON_FILE),
+    "ihg": (ihg_ingetion.IHGAdapter, ihg_ingetion.JSON_FILE),
+    "marriott": (marriot_ingetion.MarriottAdapter, marriot_ingetion.JSON_FILE),
+}
+
+# =====================================================
+# JOBS
+# =====================================================
+def lock_keys(names):
+    keys = [CHAINS[n][0].chain_code for n in names if n in CHAINS]
+    if "hyatt" in names:
+        keys.append(hyatt.LOCK_KEY)
+    return keys
+
+def check_lock_keys(conn, keys):
+    """Chain codes double as lock keys, so they (and their hashes) must be unique."""
+    if len(set(keys)) != len(keys):
+        raise SystemExit(f"❌ Duplicate chain codes configured: {keys}")
+    cur = conn.cursor()
+    cur.execute("SELECT count(DISTINCT hashtext(k)) FROM unnest(%s::text[]) AS k", (keys,))
+    distinct = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    if distinct != len(keys):
+        raise SystemExit(f"❌ Chain codes {keys} collide on their advisory lock hash")
+
+def run_job(pool, name, workers, resume):
+    """Run one chain on a pooled connection; returns a summary dict."""
+    summary = {"chain": name, "status": "ok", "seconds": 0.0, "detail": ""}
+    started = time.perf_counter()
+    conn = pool.getconn()
+    broken = False
+    try:
+        if name == "hyatt":
+            matched, unmatched = hyatt.run(conn)
+            summary["detail"] = f"{len(matched)} matched, {len(unmatched)} unmatched"
+        else:
+            adapter_cls, json_file = CHAINS[name]
+            stats = ingest_chain(conn, adapter_cls(), iter_hotels(json_file), workers=workers,
+                                 source=json_file, resume=resume)
+            summary["stats"] = stats
+            summary["detail"] = format_stats(stats)
+    except ChainBusy:
+        summary["status"] = "busy"
+        summary["detail"] = "already running in another session"
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["detail"] = f"{type(e).__name__}: {e}"
+        broken = True
+    finally:
+        pool.putconn(conn, close=broken or conn.closed)
+        summary["seconds"] = time.perf_counter() - started
+    return summary
+
+def print_summary(summaries, total_seconds):
+    print("\n📊 Ingestion summary")
+    for s in summaries:
+        icon = {"ok": "✅", "busy": "⏳", "failed": "❌"}[s["status"]]
+        print(f"{icon} {s['chain']:<9} {s['seconds']:8.1f}s  {s['detail']}")
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    for s in summaries:
+        for k in totals:
+            totals[k] += s.get("stats", {}).get(k, 0)
+    print(f"Σ {total_seconds:.1f}s wall clock — {totals['inserted']} inserted, {totals['updated']} updated, "
+          f"{totals['unchanged']} unchanged, {totals['failed']} failed")
+
+# =====================================================
+# RUN
+# =====================================================
+def main():
+    names = list(CHAINS) + ["hyatt"]
+    parser = argparse.ArgumentParser(description="Run the chain ingestions concurrently")
+    parser.add_argument("--chains", nargs="+", choices=names, default=names)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse worker processes per chain (see ingest_chain)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore checkpoints and start every chain from the first record")
+    args = parser.parse_args()
+
+    pool = ThreadedConnectionPool(1, len(args.chains), **DB_CONFIG)
+    conn = pool.getconn()
+    check_lock_keys(conn, lock_keys(args.chains))
+    ensure_schema(conn)  # DDL once, before the chains read hotel_masterfile concurrently
+    pool.putconn(conn)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(args.chains)) as executor:
+        futures = [executor.submit(run_job, pool, name, args.workers, not args.restart) for name in args.chains]
+        summaries = [f.result() for f in futures]
+    pool.closeall()
+
+    print_summary(summaries, time.perf_counter() - started)
+    if any(s["status"] == "failed" for s in summaries):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mapping_with_csl import build_candidate_index, match_master_rows, normalize_name
+
+# =====================================================
+# SYNTHETIC DATA
+# =====================================================
+WORDS = (
+    "grand hotel inn suites hyatt hilton garden plaza park city beach resort "
+    "tower central airport north south east west downtown harbor lake river"
+).split()
+COUNTRIES = ["US", "US", "US", "CA", "GB", "MX", "DE", "FR", "JP", "AU"]
+CHAINS = ["HY", "HI", "MC", "IC", None]
+
+def random_name(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+
+def build_data(master_rows, csl_rows, seed):
+    rng = random.Random(seed)
+    excel_records = []
+    for i in range(csl_rows):
+        name = random_name(rng)
+        excel_records.append({
+            "Global Property ID": str(100000 + i),
+            "Global Property Name": name,
+            "Global Chain Code": rng.choice(CHAINS),
+            "Property Country Code": rng.choice(COUNTRIES),
+            "normalized_name": normalize_name(name),
+        })
+
+    master = []
+    for i in range(master_rows):
+        if rng.random() < 0.6:
+            # Perturbed copy of a CSL hotel so a realistic share of rows match
+            src = rng.choice(excel_records)
+            name = src["Global Property Name"] + " " + rng.choice(WORDS)
+            country = src["Property Country Code"]
+        else:
+            name = random_name(rng)
+            country = rng.choice(COUNTRIES + [None])
+        master.append({"hotel_code": f"M{i}", "name": name, "country_code": country})
+
+    df_master = pd.DataFrame(master)
+    df_master["normalized_name"] = df_master["name"].apply(normalize_name)
+    return df_master, excel_records
+
+# =====================================================
+# BENCHMARK
+# =====================================================
+def timed_match(df_master, excel_records, workers):
+    start = time.perf_counter()
+    candidate_index = build_candidate_index(excel_records)
+    matched, unmatched = match_master_rows(df_master, excel_records, candidate_index, workers=workers)
+    return time.perf_counter() - start, matched, unmatched
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs parallel CSL fuzzy matching benchmark")
+    parser.add_argument("--master-rows", type=int, default=20000)
+    parser.add_argument("--csl-rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df_master, excel_records = build_data(args.master_rows, args.csl_rows, args.seed)
+    print(f"📦 {len(df_master)} master rows vs {len(excel_records)} CSL rows")
+
+    serial_time, serial_matched, serial_unmatched = timed_match(df_master, excel_records, 1)
+    print(f"🐢 serial:            {serial_time:8.2f}s ({len(serial_matched)} matched)")
+
+    parallel_time, parallel_matched, parallel_unmatched = timed_match(df_master, excel_records, args.workers)
+    print(f"🚀 {args.workers:2d} workers:        {parallel_time:8.2f}s ({len(parallel_matched)} matched)")
+
+    identical = serial_matched == parallel_matched and serial_unmatched == parallel_unmatched
+    print(f"⚡ speedup: {serial_time / parallel_time:.2f}x — results identical: {identical}")
+    if not identical:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
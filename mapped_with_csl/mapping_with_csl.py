@@ -1,9 +1,26 @@
+import argparse
+import collections
+import datetime
+import hashlib
+import io
+import multiprocessing
+import os
+import sqlite3
 import pandas as pd
+import numpy as np
 import psycopg2
 import re
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
 import json
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+from openpyxl import load_workbook
+from scipy.spatial import cKDTree
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow every run streams the workbook
+    pa = pq = None
 
 # =====================================================
 # CONFIG
@@ -18,6 +35,47 @@ DB_CONFIG = {
     "password": "dost"
 }
 
+# CSL columns read from the workbook; everything else in the sheet is ignored
+CSL_TEXT_COLUMNS = [
+    "Global Property ID",
+    "Global Property Name",
+    "Global Chain Code",
+    "Property Country Code",
+    "Property State/Province",
+    "Property City Name",
+    "Property Zip/Postal",
+    "Property Address 1",
+    "Property Address 2",
+    "Primary Airport Code",
+    "Property Phone Number",
+    "Property Fax Number",
+]
+CSL_NUMERIC_COLUMNS = ["Property Latitude", "Property Longitude", "Sabre Property Rating"]
+SNAPSHOT_DIR = ".csl_snapshots"  # typed Parquet copies of the workbook, keyed by content hash
+
+# Fuzzy matching rules
+MATCH_THRESHOLD = 80
+CHAIN_BONUS = 5
+BONUS_CHAIN_CODES = ("HY", "HI")
+MATCH_CHUNK_SIZE = 512  # master rows scored per cdist call
+MATCH_CHUNK_CELLS = 4_000_000  # cap on master x CSL scores per cdist call (float64: ~32 MB)
+MATCH_SHARD_SIZE = 4096  # master rows per worker task in parallel mode
+
+# Spatial candidate pruning
+GEO_RADIUS_KM = 5.0  # only CSL hotels this close to a geocoded master row are scored
+EARTH_RADIUS_KM = 6371.0088
+
+# Database-side candidate retrieval (--engine trgm)
+TRGM_SIMILARITY = 0.3  # pg_trgm.similarity_threshold used by the % operator
+TRGM_TOP_K = 10  # candidates fetched per master row and rescored in Python
+
+# Incremental runs
+FETCH_BATCH_SIZE = 5000  # rows per round trip from the server-side cursor
+
+# Cross-run cache of fuzzy match results
+MATCH_CACHE_FILE = "csl_match_cache.sqlite"
+MATCH_CACHE_FORMAT = 2  # bump when the cache tables change shape
+
 # =====================================================
 # HELPERS
 # =====================================================
@@ -67,189 +125,1044 @@ def safe_int(value, max_val=None):
     except:
         return None
 
+def copy_value(value):
+    """Render one value in COPY text format."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+def copy_buffer(rows):
+    """In-memory COPY text stream for an iterable of tuples."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+def phone_digits(value):
+    """
+    Last 10 digits of a phone number, so "+1 205-731-3600" and
+    "2057313600" compare equal. None when too short to identify a hotel.
+    """
+    if is_missing(value):
+        return None
+    digits = re.sub(r"\D", "", normalize_hotel_code(value))
+    return digits[-10:] if len(digits) >= 7 else None
+
+def normalize_postal(value):
+    """Upper-case alphanumerics of a postal code."""
+    if is_missing(value):
+        return None
+    return re.sub(r"[^A-Z0-9]", "", normalize_hotel_code(value).upper()) or None
+
+def is_missing(value):
+    """True for None, NaN and empty strings."""
+    if value is None:
+        return True
+    if isinstance(value, float) and np.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+def to_float_array(values):
+    """Coerce lat/lon-like values (None, str, Decimal) to a float array with NaN gaps."""
+    return pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+def valid_coords(lat, lon):
+    """Mask of usable coordinates; (0, 0) is treated as a missing geocode."""
+    return (
+        np.isfinite(lat) & np.isfinite(lon)
+        & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        & ~((lat == 0) & (lon == 0))
+    )
+
+def to_unit_xyz(lat, lon):
+    """Project lat/lon degrees onto the unit sphere for KD-tree lookups."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def chord_length(radius_km):
+    """Straight-line distance on the unit sphere for a great-circle radius."""
+    return 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM))
+
+def build_candidate_index(excel_records):
+    """
+    Block CSL rows by country code once per run.
+    Each block keeps the CSL row positions, their normalized names and the
+    chain bonus of every row as compact arrays, plus a KD-tree over the
+    geocoded rows. The None block holds every CSL row and serves master
+    rows without a country code.
+    """
+    blocks = {}
+    for pos, excel_row in enumerate(excel_records):
+        excel_name = excel_row['normalized_name']
+        if not excel_name:
+            continue
+        bonus = CHAIN_BONUS if excel_row.get('Global Chain Code') in BONUS_CHAIN_CODES else 0
+        country = excel_row.get('Property Country Code')
+        keys = [None] if is_missing(country) else [None, country]
+        for key in keys:
+            block = blocks.setdefault(key, {"positions": [], "names": [], "bonus": [], "lat": [], "lon": []})
+            block["positions"].append(pos)
+            block["names"].append(excel_name)
+            block["bonus"].append(bonus)
+            block["lat"].append(excel_row.get('Property Latitude'))
+            block["lon"].append(excel_row.get('Property Longitude'))
+
+    index = {}
+    for key, block in blocks.items():
+        lat, lon = to_float_array(block["lat"]), to_float_array(block["lon"])
+        geocoded = valid_coords(lat, lon)
+        index[key] = {
+            "positions": np.asarray(block["positions"], dtype=np.int64),
+            "names": block["names"],
+            "bonus": np.asarray(block["bonus"], dtype=np.float64),
+            # Rows without coordinates cannot be pruned spatially, so every
+            # geocoded master row is still scored against them
+            "geo_rows": np.flatnonzero(geocoded),
+            "open_rows": np.flatnonzero(~geocoded),
+            "tree": cKDTree(to_unit_xyz(lat[geocoded], lon[geocoded])) if geocoded.any() else None,
+        }
+    return index
+
+def score_block(master_names, block, master_coords=None, radius_km=0):
+    """
+    Score master names against one candidate block in bulk.
+    Master rows with coordinates (when radius_km > 0) are only scored
+    against CSL rows within radius_km of them; the rest are scored against
+    the whole block. Returns (CSL row position, score) arrays; position is
+    -1 when no candidate reaches MATCH_THRESHOLD.
+    """
+    best_pos = np.full(len(master_names), -1, dtype=np.int64)
+    best_score = np.zeros(len(master_names), dtype=np.float64)
+    if not block or not master_names:
+        return best_pos, best_score
+
+    spatial = np.zeros(len(master_names), dtype=bool)
+    if radius_km > 0 and master_coords is not None and block["tree"] is not None:
+        spatial = valid_coords(master_coords[:, 0], master_coords[:, 1])
+
+    # Candidates below this raw score cannot reach the threshold even with the bonus
+    cutoff = MATCH_THRESHOLD - CHAIN_BONUS
+
+    # Fewer rows per call for big blocks (the None block holds every CSL row)
+    chunk_size = max(1, min(MATCH_CHUNK_SIZE, MATCH_CHUNK_CELLS // len(block["names"])))
+    dense_rows = np.flatnonzero(~spatial)
+    for start in range(0, len(dense_rows), chunk_size):
+        rows = dense_rows[start:start + chunk_size]
+        scores = process.cdist(
+            [master_names[i] for i in rows],
+            block["names"],
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=cutoff,
+            dtype=np.float64,
+        )
+        scores += block["bonus"]
+        top = scores.argmax(axis=1)
+        top_score = scores[np.arange(len(rows)), top]
+        hit = top_score >= MATCH_THRESHOLD
+        best_pos[rows] = np.where(hit, block["positions"][top], -1)
+        best_score[rows] = np.where(hit, top_score, 0)
+
+    geo_rows = np.flatnonzero(spatial)
+    if len(geo_rows):
+        neighbours = block["tree"].query_ball_point(
+            to_unit_xyz(master_coords[geo_rows, 0], master_coords[geo_rows, 1]),
+            r=chord_length(radius_km),
+        )
+        for i, near in zip(geo_rows, neighbours):
+            # Sorted block order keeps the first-best tie-break of the dense path
+            candidates = np.sort(np.concatenate([block["geo_rows"][near], block["open_rows"]]))
+            if not len(candidates):
+                continue
+            scores = process.cdist(
+                [master_names[i]],
+                [block["names"][j] for j in candidates],
+                scorer=fuzz.token_sort_ratio,
+                score_cutoff=cutoff,
+                dtype=np.float64,
+            )[0] + block["bonus"][candidates]
+            top = scores.argmax()
+            if scores[top] >= MATCH_THRESHOLD:
+                best_pos[i] = block["positions"][candidates[top]]
+                best_score[i] = scores[top]
+    return best_pos, best_score
+
+def file_fingerprint(path):
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def rules_fingerprint(radius_km=0, engine="python"):
+    """Hash of every setting that changes which CSL row a name matches."""
+    rules = {
+        "threshold": MATCH_THRESHOLD,
+        "chain_bonus": CHAIN_BONUS,
+        "bonus_chain_codes": sorted(BONUS_CHAIN_CODES),
+        "scorer": "token_sort_ratio",
+        "radius_km": radius_km,
+        "engine": engine,
+    }
+    if engine == "trgm":
+        rules["trgm"] = [TRGM_SIMILARITY, TRGM_TOP_K]
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+
+def match_key(normalized_name, country, coords=None):
+    """
+    Cache key for a master row: hash of (normalized name, country code),
+    plus the rounded coordinates when the row was pruned spatially.
+    """
+    raw = f"{normalized_name}\x1f{'' if is_missing(country) else country}"
+    if coords is not None:
+        raw += f"\x1f{coords[0]:.5f},{coords[1]:.5f}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
 # =====================================================
-# LOAD EXCEL
+# EXACT MATCH PASSES
 # =====================================================
-print("📄 Loading Excel file...")
-df_excel = pd.read_excel(EXCEL_FILE)
-df_excel = df_excel.where(pd.notnull(df_excel), None)
-df_excel['normalized_name'] = df_excel['Global Property Name'].apply(normalize_name)
-df_excel['Global Property ID'] = df_excel['Global Property ID'].apply(normalize_hotel_code)  # Normalize hotel codes
+def phone_key(phone, country):
+    """Phone digits within a country; None when either is missing."""
+    digits = phone_digits(phone)
+    return (digits, country) if digits and not is_missing(country) else None
+
+def address_key(address, postal, country):
+    """(normalized address, postal code, country); None when any is missing."""
+    address = normalize_name(address)
+    postal = normalize_postal(postal)
+    return (address, postal, country) if address and postal and not is_missing(country) else None
+
+def build_exact_index(excel_records):
+    """
+    Hash indexes for the exact passes that run before fuzzy scoring:
+    (normalized name, country), (phone digits, country) and (normalized
+    address, postal code, country). A name key goes to the first CSL row,
+    unless a later one earns CHAIN_BONUS and it does not, as in the fuzzy
+    tie-break; phone and address keys shared by several CSL rows are
+    ambiguous and dropped.
+    """
+    by_name, by_phone, by_address = {}, {}, {}
+    ambiguous_phone, ambiguous_address = set(), set()
+    for pos, excel_row in enumerate(excel_records):
+        country = excel_row.get('Property Country Code')
+        if excel_row['normalized_name'] and not is_missing(country):
+            key = (excel_row['normalized_name'], country)
+            current = by_name.get(key)
+            bonus = excel_row.get('Global Chain Code') in BONUS_CHAIN_CODES
+            if current is None or (bonus and excel_records[current].get('Global Chain Code') not in BONUS_CHAIN_CODES):
+                by_name[key] = pos
+
+        phone = phone_key(excel_row.get('Property Phone Number'), country)
+        if phone:
+            if phone in by_phone:
+                ambiguous_phone.add(phone)
+            by_phone[phone] = pos
+
+        address = address_key(excel_row.get('Property Address 1'), excel_row.get('Property Zip/Postal'), country)
+        if address:
+            if address in by_address:
+                ambiguous_address.add(address)
+            by_address[address] = pos
+
+    for key in ambiguous_phone:
+        del by_phone[key]
+    for key in ambiguous_address:
+        del by_address[key]
+    return {"name": by_name, "phone": by_phone, "address": by_address}
+
+def shared_master_keys(master_records):
+    """
+    Phone and address keys carried by more than one master row (a chain's
+    toll-free line, a shared mall address). They cannot tell those hotels
+    apart, so the exact passes skip them.
+    """
+    counts = collections.Counter()
+    for master_row in master_records:
+        country = master_row.get('country_code')
+        for key in (phone_key(master_row.get('phone_number'), country),
+                    address_key(master_row.get('address_line_1'), master_row.get('postal_code'), country)):
+            if key is not None:
+                counts[key] += 1
+    return {key for key, n in counts.items() if n > 1}
+
+def exact_match(master_row, exact_index, shared_keys=frozenset()):
+    """Return (CSL row position, pass name) for the first exact pass that hits."""
+    country = master_row.get('country_code')
+    if not is_missing(country):
+        pos = exact_index["name"].get((master_row['normalized_name'], country))
+        if pos is not None:
+            return pos, "exact_name"
+
+    phone = phone_key(master_row.get('phone_number'), country)
+    if phone and phone not in shared_keys and phone in exact_index["phone"]:
+        return exact_index["phone"][phone], "exact_phone"
+
+    address = address_key(master_row.get('address_line_1'), master_row.get('postal_code'), country)
+    if address and address not in shared_keys and address in exact_index["address"]:
+        return exact_index["address"][address], "exact_address"
+    return None, None
 
 # =====================================================
-# CONNECT TO DATABASE
+# MATCH CACHE
 # =====================================================
-print("🔌 Connecting to database...")
-conn = psycopg2.connect(**DB_CONFIG)
-cur = conn.cursor()
+def csl_positions(excel_records):
+    """Global Property ID -> current CSL row position (first row wins)."""
+    positions = {}
+    for pos, excel_row in enumerate(excel_records):
+        csl_id = excel_row.get('Global Property ID')
+        if not is_missing(csl_id):
+            positions.setdefault(csl_id, pos)
+    return positions
+
+def open_match_cache(path, fingerprint, excel_records):
+    """
+    Open the SQLite match cache and load its entries.
+    Matches are stored by CSL Global Property ID rather than row position,
+    so a change in how the workbook is read cannot point them at the wrong
+    row. Entries written under a different CSL file or rule fingerprint
+    are dropped, as are those whose ID is no longer in the list. Returns
+    {"conn", "entries", "ids"} where entries maps a match key to (CSL row
+    position, score); position -1 records a known non-match.
+    """
+    fingerprint = f"v{MATCH_CACHE_FORMAT}:{fingerprint}"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY CHECK (id = 1), fingerprint TEXT NOT NULL)")
+
+    row = conn.execute("SELECT fingerprint FROM cache_meta WHERE id = 1").fetchone()
+    if not row or row[0] != fingerprint:
+        if row:
+            print("♻️ CSL file or match rules changed — clearing match cache")
+        # Also replaces match_cache tables from before csl_id was stored
+        conn.execute("DROP TABLE IF EXISTS match_cache")
+        conn.execute("INSERT OR REPLACE INTO cache_meta (id, fingerprint) VALUES (1, ?)", (fingerprint,))
+        conn.commit()
+    conn.execute("CREATE TABLE IF NOT EXISTS match_cache (match_key TEXT PRIMARY KEY, csl_id TEXT, score REAL NOT NULL)")
+
+    ids = [excel_row.get('Global Property ID') for excel_row in excel_records]
+    positions = csl_positions(excel_records)
+    entries = {}
+    for key, csl_id, score in conn.execute("SELECT match_key, csl_id, score FROM match_cache"):
+        if csl_id is None:
+            entries[key] = (-1, score)
+        elif csl_id in positions:
+            entries[key] = (positions[csl_id], score)
+    return {"conn": conn, "entries": entries, "ids": ids}
+
+def store_match_cache(cache, new_entries):
+    """
+    Persist freshly scored {match key: (CSL row position, score)} pairs.
+    Matches to a CSL row without a Global Property ID are not cached.
+    """
+    rows = []
+    for key, (pos, score) in new_entries.items():
+        csl_id = cache["ids"][pos] if pos >= 0 else None
+        if pos >= 0 and is_missing(csl_id):
+            continue
+        rows.append((key, csl_id, float(score)))
+    if not rows:
+        return
+    cache["conn"].executemany(
+        "INSERT OR REPLACE INTO match_cache (match_key, csl_id, score) VALUES (?, ?, ?)",
+        rows,
+    )
+    cache["conn"].commit()
+    cache["entries"].update(new_entries)
 
 # =====================================================
-# FETCH MASTERFILE DATA
+# DATABASE TRIGRAM ENGINE
 # =====================================================
-print("📥 Fetching MASTERFILE data...")
-cur.execute("SELECT * FROM web_scraped_hotels;")
-master_cols = [desc[0] for desc in cur.description]
-master_data = cur.fetchall()
-df_master = pd.DataFrame(master_data, columns=master_cols)
-df_master['normalized_name'] = df_master['name'].apply(normalize_name)
-df_master['hotel_code'] = df_master['hotel_code'].apply(normalize_hotel_code)  # Normalize hotel codes
+# normalize_name() in SQL, for master names read straight from web_scraped_hotels
+NORMALIZED_NAME_SQL = "btrim(regexp_replace(regexp_replace(lower(m.name), '[^a-z0-9 ]+', ' ', 'g'), ' +', ' ', 'g'))"
+
+def sync_csl_table(conn, excel_records, fingerprint):
+    """
+    Mirror the CSL names into csl_properties with a GIN trigram index.
+    Rows are keyed by Global Property ID, like the match cache, so they
+    never depend on how the workbook rows were read. The table is only
+    rebuilt when the workbook or MATCH_CACHE_FORMAT fingerprint changes.
+    """
+    fingerprint = f"v{MATCH_CACHE_FORMAT}:{fingerprint}"
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    row = None
+    cur.execute("SELECT to_regclass('csl_properties');")
+    if cur.fetchone()[0] is not None:
+        cur.execute("SELECT csl_fingerprint FROM csl_properties LIMIT 1;")
+        row = cur.fetchone()
+    if not row or row[0] != fingerprint:
+        print("🐘 Loading CSL names into csl_properties...")
+        # Also replaces tables from before csl_id was stored
+        cur.execute("DROP TABLE IF EXISTS csl_properties;")
+        cur.execute("""
+            CREATE TABLE csl_properties (
+                csl_id text PRIMARY KEY,
+                normalized_name text NOT NULL,
+                country_code text,
+                csl_fingerprint text NOT NULL
+            );
+        """)
+        execute_values(
+            cur,
+            "INSERT INTO csl_properties (csl_id, normalized_name, country_code, csl_fingerprint) VALUES %s",
+            [
+                (csl_id, excel_records[pos]['normalized_name'],
+                 None if is_missing(excel_records[pos].get('Property Country Code')) else excel_records[pos]['Property Country Code'],
+                 fingerprint)
+                for csl_id, pos in csl_positions(excel_records).items()
+                if excel_records[pos]['normalized_name']
+            ],
+            page_size=1000,
+        )
+        cur.execute("CREATE INDEX csl_properties_name_trgm ON csl_properties USING gin (normalized_name gin_trgm_ops);")
+        cur.execute("CREATE INDEX csl_properties_country ON csl_properties (country_code);")
+        cur.execute("ANALYZE csl_properties;")
+    conn.commit()
+    cur.close()
+
+def score_rows_trgm(conn, master_codes, master_names, excel_records):
+    """
+    Fetch the TRGM_TOP_K most similar CSL names per master row in one
+    set-based query, then rescore only those with token_sort_ratio and the
+    chain bonus. The master side is read from web_scraped_hotels itself,
+    selected by hotel_code, instead of being uploaded again; rows without
+    a hotel_code get no candidates. Returns (CSL row position, score)
+    arrays like score_block.
+    """
+    best_pos = np.full(len(master_names), -1, dtype=np.int64)
+    best_score = np.zeros(len(master_names), dtype=np.float64)
+    rows_by_code = {}
+    for i, code in enumerate(master_codes):
+        if not is_missing(code):
+            rows_by_code.setdefault(code, []).append(i)
+    if not rows_by_code:
+        return best_pos, best_score
 
-print(f"🔎 Loaded {len(df_master)} MASTERFILE rows")
-print(f"🔎 Loaded {len(df_excel)} Excel rows")
+    cur = conn.cursor()
+    cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true);", (str(TRGM_SIMILARITY),))
+    cur.execute(f"""
+        SELECT m.hotel_code::text, c.csl_id
+        FROM web_scraped_hotels m
+        CROSS JOIN LATERAL (SELECT {NORMALIZED_NAME_SQL} AS normalized_name) n
+        CROSS JOIN LATERAL (
+            SELECT c.csl_id
+            FROM csl_properties c
+            WHERE c.normalized_name %% n.normalized_name
+              AND (coalesce(btrim(m.country_code), '') = '' OR c.country_code = m.country_code)
+            ORDER BY similarity(c.normalized_name, n.normalized_name) DESC, c.csl_id
+            LIMIT %s
+        ) c
+        WHERE m.hotel_code::text = ANY(%s);
+    """, (TRGM_TOP_K, list(rows_by_code)))
+    by_id = csl_positions(excel_records)
+    candidates = {}
+    for code, csl_id in cur.fetchall():
+        pos = by_id.get(csl_id)
+        if pos is None:
+            continue
+        for i in rows_by_code.get(code, ()):
+            candidates.setdefault(i, []).append(pos)
+    conn.commit()
+    cur.close()
+
+    cutoff = MATCH_THRESHOLD - CHAIN_BONUS
+    for i, positions in candidates.items():
+        # CSL order keeps the first-best tie-break of the in-memory engine
+        positions = sorted(positions)
+        scores = process.cdist(
+            [master_names[i]],
+            [excel_records[pos]['normalized_name'] for pos in positions],
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=cutoff,
+            dtype=np.float64,
+        )[0]
+        scores += [CHAIN_BONUS if excel_records[pos].get('Global Chain Code') in BONUS_CHAIN_CODES else 0 for pos in positions]
+        top = scores.argmax()
+        if scores[top] >= MATCH_THRESHOLD:
+            best_pos[i] = positions[top]
+            best_score[i] = scores[top]
+    return best_pos, best_score
 
 # =====================================================
-# ENHANCED MERGE — FUZZY MATCH + COUNTRY + CHAIN BOOST
+# PARALLEL MATCHING
 # =====================================================
-print("🤖 Performing fuzzy match (≥80% threshold)...")
+_worker_index = None
+_worker_radius_km = 0
 
-excel_records = df_excel.to_dict(orient="records")
-matched_rows = []
-unmatched_rows = []
+def _init_match_worker(candidate_index, radius_km=0):
+    global _worker_index, _worker_radius_km
+    _worker_index = candidate_index
+    _worker_radius_km = radius_km
 
-for _, master_row in df_master.iterrows():
-    master_name = master_row['normalized_name']
-    master_country = master_row.get('country_code', None)
-    if not master_name:
-        continue
+def _score_shard(shard):
+    country, start, names, coords = shard
+    return country, start, score_block(names, _worker_index.get(country), coords, _worker_radius_km)
 
-    candidates = (
-        [r for r in excel_records if r.get('Property Country Code') == master_country]
-        if master_country else excel_records
-    )
+def plan_shards(groups, master_records, master_coords):
+    """
+    Split the per-country master row groups into worker tasks.
+    Tasks only carry the country key, the normalized names and the
+    coordinates; large countries are cut into MATCH_SHARD_SIZE slices so
+    one country cannot pin a single worker. Biggest tasks go first.
+    """
+    shards = []
+    for country, rows in groups.items():
+        for start in range(0, len(rows), MATCH_SHARD_SIZE):
+            shard_rows = rows[start:start + MATCH_SHARD_SIZE]
+            names = [master_records[i]['normalized_name'] for i in shard_rows]
+            shards.append((country, start, names, master_coords[shard_rows]))
+    shards.sort(key=lambda shard: len(shard[2]), reverse=True)
+    return shards
 
-    best_match = None
-    best_score = 0
+def match_master_rows(df_master, excel_records, candidate_index, workers=1, cache=None, exact_index=None,
+                      radius_km=0, trgm_conn=None, shared_keys=None):
+    """
+    Match every MASTERFILE row to the CSL list in passes.
+    With an exact index, rows are first hash-joined on (name, country),
+    then phone digits, then address + postal code (both within the same
+    country); only the remaining rows are fuzzy matched against their
+    country block. Each match records the pass that produced it in
+    "match_pass". Phone and address keys in shared_keys (by default those
+    repeated within df_master, see shared_master_keys) are not used.
 
-    # Fuzzy name matching
-    for excel_row in candidates:
-        excel_name = excel_row['normalized_name']
-        if not excel_name:
+    Rows without a normalized name are skipped. With workers > 1 the
+    country shards are scored in a process pool; results are written back
+    by row position, so output order and content match the serial path.
+    With a match cache, rows whose (name, country) key was scored on an
+    earlier run reuse the stored result and only the rest are scored.
+    With radius_km > 0, geocoded rows are only scored against CSL hotels
+    within that distance; rows without coordinates use the country block.
+    With a trgm_conn, candidates come from the csl_properties trigram index
+    in Postgres instead of the in-memory blocks (no spatial pruning).
+    """
+    master_records = df_master.to_dict(orient="records")
+    master_coords = np.column_stack([
+        to_float_array(r.get('latitude') for r in master_records),
+        to_float_array(r.get('longitude') for r in master_records),
+    ]).reshape(len(master_records), 2)
+    geocoded = valid_coords(master_coords[:, 0], master_coords[:, 1]) if radius_km > 0 else None
+    best_pos = np.full(len(master_records), -1, dtype=np.int64)
+    best_score = np.zeros(len(master_records), dtype=np.float64)
+    match_pass = [None] * len(master_records)
+    if exact_index is not None and shared_keys is None:
+        shared_keys = shared_master_keys(master_records)
+
+    groups = {}
+    keys = {}
+    cache_hits = 0
+    for i, master_row in enumerate(master_records):
+        if not master_row['normalized_name']:
             continue
+        if exact_index is not None:
+            pos, pass_name = exact_match(master_row, exact_index, shared_keys)
+            if pos is not None:
+                best_pos[i], best_score[i], match_pass[i] = pos, 100.0, pass_name
+                continue
+        country = master_row.get('country_code')
+        if cache is not None:
+            coords = master_coords[i] if geocoded is not None and geocoded[i] else None
+            keys[i] = match_key(master_row['normalized_name'], country, coords)
+            cached = cache["entries"].get(keys[i])
+            if cached is not None:
+                best_pos[i], best_score[i] = cached
+                cache_hits += 1
+                continue
+        groups.setdefault(None if is_missing(country) else country, []).append(i)
 
-        score = fuzz.token_sort_ratio(master_name, excel_name)
+    if trgm_conn is not None:
+        rows = [i for group in groups.values() for i in group]
+        pos, score = score_rows_trgm(
+            trgm_conn,
+            [master_records[i].get('hotel_code') for i in rows],
+            [master_records[i]['normalized_name'] for i in rows],
+            excel_records,
+        )
+        best_pos[rows] = pos
+        best_score[rows] = score
+    else:
+        shards = plan_shards(groups, master_records, master_coords)
+        if workers > 1 and len(shards) > 1:
+            with multiprocessing.Pool(
+                min(workers, len(shards)),
+                initializer=_init_match_worker,
+                initargs=(candidate_index, radius_km),
+            ) as pool:
+                results = list(pool.imap_unordered(_score_shard, shards))
+        else:
+            _init_match_worker(candidate_index, radius_km)
+            results = [_score_shard(shard) for shard in shards]
 
-        # Add bonus for HY or HI chain codes
-        chain_code = excel_row.get('Global Chain Code')
-        if chain_code in ('HY', 'HI'):
-            score += 5
+        for country, start, (pos, score) in results:
+            rows = groups[country][start:start + len(pos)]
+            best_pos[rows] = pos
+            best_score[rows] = score
 
-        if score > best_score:
-            best_score = score
-            best_match = excel_row
+    if cache is not None:
+        scored = [i for rows in groups.values() for i in rows]
+        store_match_cache(cache, {keys[i]: (best_pos[i], best_score[i]) for i in scored})
+        print(f"🗃️ Match cache: {cache_hits} reused, {len(scored)} scored")
+
+    matched_rows = []
+    unmatched_rows = []
+    for i, master_row in enumerate(master_records):
+        if not master_row['normalized_name']:
+            continue
+        if best_pos[i] >= 0:
+            best_match = excel_records[best_pos[i]]
+            merged = {**master_row, **{f"{k}_excel": v for k, v in best_match.items()}}
+            merged["match_score"] = float(best_score[i])
+            merged["match_pass"] = match_pass[i] or "fuzzy"
+            matched_rows.append(merged)
+        else:
+            unmatched_rows.append(master_row)
+    return matched_rows, unmatched_rows
 
-    if best_score >= 80 and best_match:
-        merged = {**master_row.to_dict(), **{f"{k}_excel": v for k, v in best_match.items()}}
-        merged["match_score"] = best_score
-        matched_rows.append(merged)
+# =====================================================
+# LOAD EXCEL
+# =====================================================
+def read_excel_streaming(path):
+    """
+    Read the CSL columns from the first sheet with openpyxl in read-only
+    mode. Rows are streamed and only the wanted cells are kept, so memory
+    is bounded by the selected columns rather than the whole workbook.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else None for h in next(rows, ())]
+        wanted = [c for c in CSL_TEXT_COLUMNS + CSL_NUMERIC_COLUMNS if c in header]
+        positions = [header.index(c) for c in wanted]
+        columns = {c: [] for c in wanted}
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            for c, i in zip(wanted, positions):
+                columns[c].append(row[i] if i < len(row) else None)
+    finally:
+        wb.close()
+
+    # Typed columns: text cells as strings (integral floats lose their .0), coordinates/ratings as floats
+    data = {}
+    for c, values in columns.items():
+        if c in CSL_NUMERIC_COLUMNS:
+            data[c] = to_float_array(values)
+        else:
+            data[c] = [None if is_missing(v) else normalize_hotel_code(v) for v in values]
+    return pd.DataFrame(data, columns=wanted)
+
+def write_snapshot(df_excel, snapshot_path):
+    """Write the typed CSL frame to Parquet, replacing older snapshots."""
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    table = pa.table({
+        c: pa.array(df_excel[c].tolist(), type=pa.float64() if c in CSL_NUMERIC_COLUMNS else pa.string(), from_pandas=True)
+        for c in df_excel.columns
+    })
+    tmp_path = snapshot_path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, snapshot_path)
+    for name in os.listdir(os.path.dirname(snapshot_path)):
+        stale = os.path.join(os.path.dirname(snapshot_path), name)
+        if name.endswith(".parquet") and stale != snapshot_path:
+            os.remove(stale)
+
+def load_excel(path, fingerprint):
+    """
+    Load the CSL list. A Parquet snapshot keyed by the workbook's content
+    hash is memory-mapped when present (only the CSL columns are read);
+    otherwise the workbook is streamed once and the snapshot written.
+    """
+    snapshot_path = os.path.join(SNAPSHOT_DIR, f"{fingerprint}.parquet")
+    if pq is not None and os.path.exists(snapshot_path):
+        print("📄 Loading CSL snapshot...")
+        available = pq.read_schema(snapshot_path).names
+        table = pq.read_table(
+            snapshot_path,
+            columns=[c for c in CSL_TEXT_COLUMNS + CSL_NUMERIC_COLUMNS if c in available],
+            memory_map=True,
+        )
+        df_excel = table.to_pandas()
     else:
-        unmatched_rows.append(master_row.to_dict())
+        print("📄 Loading Excel file...")
+        df_excel = read_excel_streaming(path)
+        if pq is not None:
+            write_snapshot(df_excel, snapshot_path)
+            print(f"🗂️ Wrote CSL snapshot {snapshot_path}")
 
-df_merged = pd.DataFrame(matched_rows)
-print(f"✅ Fuzzy matched {len(df_merged)} / {len(df_master)} MASTERFILE records")
+    df_excel = df_excel.astype(object).where(pd.notnull(df_excel), None)
+    df_excel['normalized_name'] = df_excel['Global Property Name'].apply(normalize_name)
+    df_excel['Global Property ID'] = df_excel['Global Property ID'].apply(normalize_hotel_code)  # Normalize hotel codes
+    return df_excel
 
 # =====================================================
-# PREPARE RECORDS FOR INSERT
+# FETCH MASTERFILE DATA
 # =====================================================
-records = []
-for _, row in df_merged.iterrows():
-    record = {
-        "hotel_code": normalize_hotel_code(row.get('Global Property ID_excel')) if pd.notnull(row.get('Global Property ID_excel')) else normalize_hotel_code(row['hotel_code']),
-        "chain_code": row.get('Global Chain Code_excel') if pd.notnull(row.get('Global Chain Code_excel')) else row['chain_code'],
-        "chain": row['chain'],
-        "name": row.get('Global Property Name_excel') if pd.notnull(row.get('Global Property Name_excel')) else row['name'],
-        "state_code": row.get('Property State/Province_excel') if pd.notnull(row.get('Property State/Province_excel')) else row['state_code'],
-        "state": row['state'],
-        "country_code": row.get('Property Country Code_excel') if pd.notnull(row.get('Property Country Code_excel')) else row['country_code'],
-        "country": row['country'],
-        "city": row.get('Property City Name_excel') if pd.notnull(row.get('Property City Name_excel')) else row['city'],
-        "postal_code": row.get('Property Zip/Postal_excel') if pd.notnull(row.get('Property Zip/Postal_excel')) else row['postal_code'],
-        "address_line_1": row.get('Property Address 1_excel') if pd.notnull(row.get('Property Address 1_excel')) else row['address_line_1'],
-        "address_line_2": row.get('Property Address 2_excel') if pd.notnull(row.get('Property Address 2_excel')) else row['address_line_2'],
-        "full_address": row['full_address'],
-        "latitude": safe_numeric(row.get('Property Latitude_excel')) if pd.notnull(row.get('Property Latitude_excel')) else safe_numeric(row['latitude']),
-        "longitude": safe_numeric(row.get('Property Longitude_excel')) if pd.notnull(row.get('Property Longitude_excel')) else safe_numeric(row['longitude']),
-        "primary_airport_code": row.get('Primary Airport Code_excel') if pd.notnull(row.get('Primary Airport Code_excel')) else row['primary_airport_code'],
-        "property_quality_type": row['property_quality_type'],
-        "property_style_description": row['description'] if pd.notnull(row.get('description')) else row['property_style_description'],
-        "sabre_rating": safe_numeric(row.get('Sabre Property Rating_excel'), max_val=99.9) if pd.notnull(row.get('Sabre Property Rating_excel')) else safe_numeric(row.get('sabre_rating'), max_val=99.9),
-        "sabre_context": row['sabre_context'],
-        "parking": row['parking'],
-        "links": row['links'],
-        "phone_number": row.get('Property Phone Number_excel') if pd.notnull(row.get('Property Phone Number_excel')) else row['phone_number'],
-        "fax_number": row.get('Property Fax Number_excel') if pd.notnull(row.get('Property Fax Number_excel')) else row['fax_number'],
-        "is_verified": row['is_verified'],
-        "verification_type": row['verification_type'],
-        "is_pet_friendly": row['is_pet_friendly'],
-        "pet_policy": row['pet_policy'],
-        "service_animal_policy": row['service_animal_policy'],
-        "pet_fee_night": safe_numeric(row['pet_fee_night']),
-        "pet_fee_total_max": safe_numeric(row['pet_fee_total_max']),
-        "pet_fee_deposit": safe_numeric(row['pet_fee_deposit']),
-        "pet_fee_currency": row['pet_fee_currency'],
-        "pet_fee_interval": row['pet_fee_interval'],
-        "pet_fee_variations": row['pet_fee_variations'],
-        "has_pet_deposit": row['has_pet_deposit'],
-        "is_deposit_refundable": row['is_deposit_refundable'],
-        "has_extra_fee_info": row['has_extra_fee_info'],
-        "allowed_pet_types": row['allowed_pet_types'],
-        "weight_limit": row['weight_limit'],
-        "has_extra_weight_info": row['has_extra_weight_info'],
-        "has_pet_friendly_rooms": row['has_pet_friendly_rooms'],
-        "max_pets": safe_int(row['max_pets'], max_val=150),
-        "has_max_pets_extra_info": row['has_max_pets_extra_info'],
-        "breed_restrictions": row['breed_restrictions'],
-        "pet_amenities": row['pet_amenities'],
-        "has_pet_amenities": row['has_pet_amenities'],
-        "nearby_parks": row['nearby_parks'],
-        "parks_distance_miles": safe_numeric(row['parks_distance_miles'], max_val=999.99),
-        "contact_note": row['contact_note'],
-        "followup": row['followup'],
-        "source": 'CSL_EXCEL_SCRAPING_MAPPED' if pd.notnull(row.get('Global Property Name_excel')) else 'MASTERFILE',
-        "created_at": row['created_at'],
-        "updated_at": row['updated_at'],
-        "last_updated": row['last_updated'],
-        "description": row['description']
-    }
-    records.append(record)
+def fetch_master(conn, since=None, written_at=None):
+    """
+    Read web_scraped_hotels through a server-side cursor. With since, only
+    rows whose updated_at moved past it are returned, leaving out the rows
+    stamped by the previous mapping merge itself (updated_at = written_at).
+    """
+    cur = conn.cursor(name="web_scraped_hotels_scan")
+    cur.itersize = FETCH_BATCH_SIZE
+    if since is None:
+        print("📥 Fetching MASTERFILE data...")
+        cur.execute("SELECT * FROM web_scraped_hotels;")
+    else:
+        print(f"📥 Fetching MASTERFILE rows updated since {since}...")
+        cur.execute("""
+            SELECT *
+            FROM web_scraped_hotels
+            WHERE updated_at > %s
+              AND updated_at IS DISTINCT FROM %s;
+        """, (since, written_at))
+    master_data = []
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        master_data.extend(rows)
+    master_cols = [desc[0] for desc in cur.description]
+    cur.close()
+    conn.commit()
+    df_master = pd.DataFrame(master_data, columns=master_cols)
+    df_master['normalized_name'] = df_master['name'].apply(normalize_name)
+    df_master['hotel_code'] = df_master['hotel_code'].apply(normalize_hotel_code)  # Normalize hotel codes
+    return df_master
+
+def fetch_master_keys(conn):
+    """
+    Phone and address columns of every web_scraped_hotels row, so an
+    incremental run judges shared exact-match keys against the whole
+    table rather than only the changed rows.
+    """
+    cur = conn.cursor(name="web_scraped_hotels_keys")
+    cur.itersize = FETCH_BATCH_SIZE
+    cur.execute("SELECT phone_number, address_line_1, postal_code, country_code FROM web_scraped_hotels;")
+    columns = ("phone_number", "address_line_1", "postal_code", "country_code")
+    records = [dict(zip(columns, row)) for row in cur]
+    cur.close()
+    conn.commit()
+    return records
 
 # =====================================================
-# CONVERT JSON-LIKE FIELDS TO STRINGS
+# INCREMENTAL STATE
 # =====================================================
-for record in records:
-    for field in ['links', 'pet_fee_variations', 'pet_amenities']:
-        if record.get(field) is not None:
-            record[field] = json.dumps(record[field])
+def load_mapping_state(conn):
+    """Watermark and CSL fingerprint of the last successful mapping run."""
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS csl_mapping_state (
+            id integer PRIMARY KEY CHECK (id = 1),
+            high_water timestamptz,
+            written_at timestamptz,
+            csl_fingerprint text NOT NULL,
+            finished_at timestamptz NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("SELECT high_water, written_at, csl_fingerprint FROM csl_mapping_state WHERE id = 1;")
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    if row is None:
+        return None
+    return {"high_water": row[0], "written_at": row[1], "csl_fingerprint": row[2]}
+
+def save_mapping_state(conn, high_water, written_at, csl_fingerprint):
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO csl_mapping_state (id, high_water, written_at, csl_fingerprint, finished_at)
+        VALUES (1, %s, %s, %s, NOW())
+        ON CONFLICT (id) DO UPDATE SET
+        high_water = EXCLUDED.high_water,
+        written_at = EXCLUDED.written_at,
+        csl_fingerprint = EXCLUDED.csl_fingerprint,
+        finished_at = EXCLUDED.finished_at;
+    """, (high_water, written_at, csl_fingerprint))
+    conn.commit()
+    cur.close()
+
+# =====================================================
+# PREPARE RECORDS FOR INSERT
+# =====================================================
+# (target column, preferred column, fallback column, conversion, upper clip)
+# The preferred value wins when present; CSL columns carry the _excel suffix.
+RECORD_COLUMNS = [
+    ("hotel_code", "Global Property ID_excel", "hotel_code", None, None),
+    ("chain_code", "Global Chain Code_excel", "chain_code", None, None),
+    ("chain", None, "chain", None, None),
+    ("name", "Global Property Name_excel", "name", None, None),
+    ("state_code", "Property State/Province_excel", "state_code", None, None),
+    ("state", None, "state", None, None),
+    ("country_code", "Property Country Code_excel", "country_code", None, None),
+    ("country", None, "country", None, None),
+    ("city", "Property City Name_excel", "city", None, None),
+    ("postal_code", "Property Zip/Postal_excel", "postal_code", None, None),
+    ("address_line_1", "Property Address 1_excel", "address_line_1", None, None),
+    ("address_line_2", "Property Address 2_excel", "address_line_2", None, None),
+    ("full_address", None, "full_address", None, None),
+    ("latitude", "Property Latitude_excel", "latitude", "float", None),
+    ("longitude", "Property Longitude_excel", "longitude", "float", None),
+    ("primary_airport_code", "Primary Airport Code_excel", "primary_airport_code", None, None),
+    ("property_quality_type", None, "property_quality_type", None, None),
+    ("property_style_description", "description", "property_style_description", None, None),
+    ("sabre_rating", "Sabre Property Rating_excel", "sabre_rating", "float", 99.9),
+    ("sabre_context", None, "sabre_context", None, None),
+    ("parking", None, "parking", None, None),
+    ("links", None, "links", "json", None),
+    ("phone_number", "Property Phone Number_excel", "phone_number", None, None),
+    ("fax_number", "Property Fax Number_excel", "fax_number", None, None),
+    ("is_verified", None, "is_verified", None, None),
+    ("verification_type", None, "verification_type", None, None),
+    ("is_pet_friendly", None, "is_pet_friendly", None, None),
+    ("pet_policy", None, "pet_policy", None, None),
+    ("service_animal_policy", None, "service_animal_policy", None, None),
+    ("pet_fee_night", None, "pet_fee_night", "float", None),
+    ("pet_fee_total_max", None, "pet_fee_total_max", "float", None),
+    ("pet_fee_deposit", None, "pet_fee_deposit", "float", None),
+    ("pet_fee_currency", None, "pet_fee_currency", None, None),
+    ("pet_fee_interval", None, "pet_fee_interval", None, None),
+    ("pet_fee_variations", None, "pet_fee_variations", "json", None),
+    ("has_pet_deposit", None, "has_pet_deposit", None, None),
+    ("is_deposit_refundable", None, "is_deposit_refundable", None, None),
+    ("has_extra_fee_info", None, "has_extra_fee_info", None, None),
+    ("allowed_pet_types", None, "allowed_pet_types", None, None),
+    ("weight_limit", None, "weight_limit", None, None),
+    ("has_extra_weight_info", None, "has_extra_weight_info", None, None),
+    ("has_pet_friendly_rooms", None, "has_pet_friendly_rooms", None, None),
+    ("max_pets", None, "max_pets", "int", 150),
+    ("has_max_pets_extra_info", None, "has_max_pets_extra_info", None, None),
+    ("breed_restrictions", None, "breed_restrictions", None, None),
+    ("pet_amenities", None, "pet_amenities", "json", None),
+    ("has_pet_amenities", None, "has_pet_amenities", None, None),
+    ("nearby_parks", None, "nearby_parks", None, None),
+    ("parks_distance_miles", None, "parks_distance_miles", "float", 999.99),
+    ("contact_note", None, "contact_note", None, None),
+    ("followup", None, "followup", None, None),
+    ("source", None, None, "source", None),
+    ("created_at", None, "created_at", None, None),
+    ("updated_at", None, "updated_at", None, None),
+    ("last_updated", None, "last_updated", None, None),
+    ("description", None, "description", None, None),
+]
+
+def convert_column(values, conversion, max_val):
+    """Apply one RECORD_COLUMNS conversion to a whole column."""
+    if conversion == "float":
+        values = pd.to_numeric(values, errors="coerce")
+    elif conversion == "int":
+        values = np.trunc(pd.to_numeric(values, errors="coerce")).astype("Int64")
+    elif conversion == "json":
+        values = values.map(json.dumps, na_action="ignore")
+    if max_val is not None:
+        values = values.clip(upper=max_val)
+    return values
+
+def prepare_records(df_merged):
+    """
+    Build the insert rows column by column from RECORD_COLUMNS.
+    Returns (column names, list of tuples) with missing values as None.
+    """
+    columns = [target for target, *_ in RECORD_COLUMNS]
+    if df_merged.empty:
+        return columns, []
+
+    def column(name):
+        if name in df_merged.columns:
+            return df_merged[name].astype(object)
+        return pd.Series(None, index=df_merged.index, dtype=object)
+
+    out = {}
+    for target, preferred, fallback, conversion, max_val in RECORD_COLUMNS:
+        if conversion == "source":
+            out[target] = np.where(
+                column('Global Property Name_excel').notna(), 'CSL_EXCEL_SCRAPING_MAPPED', 'MASTERFILE'
+            )
+            continue
+        values = convert_column(column(fallback), conversion, max_val)
+        if preferred is not None:
+            values = convert_column(column(preferred), conversion, max_val).combine_first(values)
+        out[target] = values
+
+    frame = pd.DataFrame(out, index=df_merged.index, columns=columns).astype(object)
+    frame = frame.where(frame.notna(), None)
+    return columns, list(frame.itertuples(index=False, name=None))
 
 # =====================================================
 # INSERT INTO DATABASE
 # =====================================================
-if records:
-    insert_cols = list(records[0].keys())
-    insert_sql = f"""
-    INSERT INTO web_scraped_hotels ({', '.join(insert_cols)})
-    VALUES ({', '.join([f'%({c})s' for c in insert_cols])})
-    ON CONFLICT (hotel_code) DO UPDATE SET
-    chain_code = EXCLUDED.chain_code,
-    name = EXCLUDED.name,
-    state_code = EXCLUDED.state_code,
-    country_code = EXCLUDED.country_code,
-    city = EXCLUDED.city,
-    postal_code = EXCLUDED.postal_code,
-    address_line_1 = EXCLUDED.address_line_1,
-    address_line_2 = EXCLUDED.address_line_2,
-    latitude = EXCLUDED.latitude,
-    longitude = EXCLUDED.longitude,
-    phone_number = EXCLUDED.phone_number,
-    source = 'CSL_EXCEL_SCRAPING_MAPPED',
-    updated_at = NOW();
-    """
-
-    print("💾 Inserting merged records into database...")
-    execute_batch(cur, insert_sql, records, page_size=50)
+# Columns refreshed when a mapped hotel_code already exists
+MERGE_UPDATE_COLUMNS = [
+    "chain_code",
+    "name",
+    "state_code",
+    "country_code",
+    "city",
+    "postal_code",
+    "address_line_1",
+    "address_line_2",
+    "latitude",
+    "longitude",
+    "phone_number",
+]
+
+def merge_records(conn, columns, records):
+    """
+    Bulk-merge records into web_scraped_hotels.
+    Rows are streamed with COPY into a temp staging table (temp tables skip
+    the WAL) and applied with one INSERT ... SELECT ... ON CONFLICT. When a
+    hotel_code appears more than once, the last record wins. Inserted and
+    updated rows alike get updated_at = NOW(), so change tracking keyed on
+    updated_at (--incremental here, etl_kruiz.py) sees the new hotels too.
+    Returns (inserted, updated) row counts and the NOW() stamped on them.
+    """
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE stage_web_scraped_hotels (LIKE web_scraped_hotels INCLUDING DEFAULTS) ON COMMIT DROP;")
+    cur.execute("ALTER TABLE stage_web_scraped_hotels ADD COLUMN load_seq bigserial;")
+    cur.copy_expert(
+        f"COPY stage_web_scraped_hotels ({', '.join(columns)}) FROM STDIN",
+        copy_buffer(records),
+    )
+
+    col_list = ", ".join(columns)
+    select_list = ", ".join("NOW()" if c == "updated_at" else c for c in columns)
+    update_sql = ",\n        ".join(f"{c} = EXCLUDED.{c}" for c in MERGE_UPDATE_COLUMNS)
+    cur.execute(f"""
+    WITH merged AS (
+        INSERT INTO web_scraped_hotels ({col_list})
+        SELECT {select_list}
+        FROM (
+            SELECT DISTINCT ON (hotel_code) *
+            FROM stage_web_scraped_hotels
+            ORDER BY hotel_code, load_seq DESC
+        ) s
+        ON CONFLICT (hotel_code) DO UPDATE SET
+        {update_sql},
+        source = 'CSL_EXCEL_SCRAPING_MAPPED',
+        updated_at = NOW()
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted), NOW()
+    FROM merged;
+    """)
+    inserted, updated, merged_at = cur.fetchone()
     conn.commit()
-    print(f"✅ SUCCESS: {len(records)} hotels inserted into web_scraped_hotels")
-else:
-    print("⚠️ No matched records found — nothing inserted.")
+    cur.close()
+    return inserted, updated, merged_at
+
+def insert_records(conn, columns, records):
+    if not records:
+        print("⚠️ No matched records found — nothing inserted.")
+        return 0, 0, None
+
+    print("💾 Merging records into web_scraped_hotels via COPY...")
+    inserted, updated, merged_at = merge_records(conn, columns, records)
+    print(f"✅ SUCCESS: {inserted} hotels inserted, {updated} updated in web_scraped_hotels")
+    return inserted, updated, merged_at
+
+# =====================================================
+# MAIN
+# =====================================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Map web_scraped_hotels onto the CSL master list")
+    parser.add_argument("--excel-file", default=EXCEL_FILE)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for fuzzy matching (1 = serial)")
+    parser.add_argument("--match-cache", default=MATCH_CACHE_FILE,
+                        help="SQLite file holding match results from earlier runs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="rescore every row and leave the match cache untouched")
+    parser.add_argument("--radius-km", type=float, default=GEO_RADIUS_KM,
+                        help="score geocoded rows only against CSL hotels this close (0 = country blocking only)")
+    parser.add_argument("--engine", choices=("python", "trgm"), default="python",
+                        help="fuzzy candidate retrieval: in-memory blocks or pg_trgm in Postgres")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only map rows whose updated_at moved since the last successful run")
+    parser.add_argument("--fuzzy-only", action="store_true",
+                        help="skip the exact name/phone/address passes")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    csl_fingerprint = file_fingerprint(args.excel_file)
+    df_excel = load_excel(args.excel_file, csl_fingerprint)
+
+    print("🔌 Connecting to database...")
+    conn = psycopg2.connect(**DB_CONFIG)
+
+    state = load_mapping_state(conn)
+    since = written_at = None
+    if args.incremental:
+        if state is None or state["high_water"] is None:
+            print("🆕 No previous mapping run recorded — mapping every row")
+        elif state["csl_fingerprint"] != csl_fingerprint:
+            print("♻️ CSL workbook changed since the last run — mapping every row")
+        else:
+            since, written_at = state["high_water"], state["written_at"]
+
+    df_master = fetch_master(conn, since, written_at)
+    print(f"🔎 Loaded {len(df_master)} MASTERFILE rows")
+    print(f"🔎 Loaded {len(df_excel)} Excel rows")
+
+    # Enhanced merge — fuzzy match + country + chain boost
+    print(f"🤖 Performing fuzzy match (≥{MATCH_THRESHOLD}% threshold, {args.engine} engine, {args.workers} worker(s))...")
+    excel_records = df_excel.to_dict(orient="records")
+    # The trigram engine retrieves candidates in Postgres and never needs the in-memory blocks
+    candidate_index = build_candidate_index(excel_records) if args.engine == "python" else None
+    exact_index = None if args.fuzzy_only else build_exact_index(excel_records)
+    shared_keys = None
+    if exact_index is not None and since is not None:
+        shared_keys = shared_master_keys(fetch_master_keys(conn))
+    # The trigram engine has no spatial pruning
+    radius_km = 0 if args.engine == "trgm" else args.radius_km
+    cache = None
+    if not args.no_cache:
+        fingerprint = hashlib.sha256(
+            f"{csl_fingerprint}:{rules_fingerprint(radius_km, args.engine)}".encode()
+        ).hexdigest()
+        cache = open_match_cache(args.match_cache, fingerprint, excel_records)
+    trgm_conn = None
+    if args.engine == "trgm":
+        sync_csl_table(conn, excel_records, csl_fingerprint)
+        trgm_conn = conn
+    matched_rows, unmatched_rows = match_master_rows(
+        df_master, excel_records, candidate_index,
+        workers=args.workers, cache=cache, exact_index=exact_index,
+        radius_km=radius_km, trgm_conn=trgm_conn, shared_keys=shared_keys,
+    )
+    if cache is not None:
+        cache["conn"].close()
+
+    df_merged = pd.DataFrame(matched_rows)
+    print(f"✅ Matched {len(df_merged)} / {len(df_master)} MASTERFILE records")
+    if not df_merged.empty:
+        for pass_name, count in df_merged["match_pass"].value_counts().items():
+            print(f"   • {pass_name}: {count}")
+
+    columns, records = prepare_records(df_merged)
+    inserted, updated, merged_at = insert_records(conn, columns, records)
+
+    # Record the watermark only once the merge has committed
+    seen = df_master["updated_at"].dropna() if "updated_at" in df_master.columns else pd.Series(dtype=object)
+    high_water = seen.max() if not seen.empty else since
+    if merged_at is None and state is not None:
+        merged_at = state["written_at"]
+    save_mapping_state(conn, high_water, merged_at, csl_fingerprint)
+
+    conn.close()
 
-cur.close()
-conn.close()
+if __name__ == "__main__":
+    main()